@@ -0,0 +1,237 @@
+import json
+import math
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, Optional, List, Iterator, Callable
+from config import settings
+from data_processor import DataProcessor
+from echarts_utils import EChartsUtils
+
+
+# 输出文件名中允许的字符
+_SAFE_NAME_PATTERN = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _run_job(job: Dict[str, Any], index: int, output_dir: Optional[str]) -> Dict[str, Any]:
+    """
+    执行单个图表任务（在工作进程中运行）
+
+    Args:
+        job: 任务描述
+        index: 任务在清单中的序号
+        output_dir: 输出目录，为空时直接返回结果内容
+
+    Returns:
+        任务结果，失败时 status 为 error
+    """
+    job_id = str(job.get("id", index))
+    result = {"id": job_id, "index": index}
+
+    try:
+        chart_type = job.get("chart_type")
+        if not chart_type:
+            raise ValueError("缺少 chart_type")
+
+        data = job.get("data")
+        if data is not None and job.get("data_type"):
+            data = DataProcessor.process_data(data, job["data_type"])
+            data = DataProcessor.format_for_echarts(
+                data, chart_type, job.get("top_n"), job.get("sort"),
+                job.get("merge_duplicates", False), job.get("other_label", "其他"),
+                job.get("reduction"), job.get("bin_shape", "square"), job.get("bin_output", "bubble"),
+                job.get("grid_size"), job.get("sample_size")
+            )
+
+        config = EChartsUtils.create_chart_config(
+            chart_type, data, job.get("title", ""), job.get("theme", "light"),
+            job.get("data_format"), job.get("significant_digits"), job.get("precision")
+        )
+        if job.get("optimize"):
+            config = EChartsUtils.optimize_config(config)
+
+        # 根据 output 字段决定输出 HTML 还是配置
+        output = job.get("output", "config")
+        if output == "html":
+            content = EChartsUtils.generate_html(config, job.get("height", "400px"))
+        elif output == "config":
+            content = config
+        else:
+            raise ValueError(f"不支持的输出类型: {output}")
+
+        if output_dir:
+            suffix = ".html" if output == "html" else ".json"
+            # 文件名带上任务序号，重复或清理后相同的 id 不会互相覆盖
+            file_name = f"{index}_{_SAFE_NAME_PATTERN.sub('_', job_id)}{suffix}"
+            file_path = os.path.join(output_dir, file_name)
+            with open(file_path, "w", encoding="utf-8") as f:
+                if output == "html":
+                    f.write(content)
+                else:
+                    json.dump(content, f, ensure_ascii=False)
+            result["file_path"] = file_path
+        else:
+            result[output] = content
+
+        result["status"] = "success"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+
+    return result
+
+
+def _run_chunk(jobs: List[Dict[str, Any]], start: int, output_dir: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    执行一组任务，减少进程间通信次数
+
+    Args:
+        jobs: 任务列表
+        start: 第一个任务在清单中的序号
+        output_dir: 输出目录
+
+    Returns:
+        任务结果列表
+    """
+    return [_run_job(job, start + i, output_dir) for i, job in enumerate(jobs)]
+
+
+class BatchProcessor:
+    """批量图表生成模块"""
+
+    @classmethod
+    def resolve_output_dir(cls, output_dir: str, root: Optional[str] = None) -> str:
+        """
+        把外部传入的输出目录解析到允许写入的根目录之下
+
+        Args:
+            output_dir: 输出目录，相对路径按根目录解析
+            root: 根目录，默认使用 settings.BATCH_OUTPUT_ROOT
+
+        Returns:
+            解析后的绝对路径
+
+        Raises:
+            ValueError: 输出目录位于根目录之外
+        """
+        root = os.path.realpath(root or settings.BATCH_OUTPUT_ROOT)
+        resolved = os.path.realpath(os.path.join(root, output_dir))
+        if os.path.commonpath([root, resolved]) != root:
+            raise ValueError(f"输出目录必须位于 {root} 之下: {output_dir}")
+        return resolved
+
+    @classmethod
+    def run(cls, jobs: List[Dict[str, Any]], output_dir: Optional[str] = None,
+            max_workers: Optional[int] = None, chunk_size: Optional[int] = None,
+            on_progress: Optional[Callable[[int, int, int], None]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        使用进程池批量生成图表，按完成顺序逐个返回结果
+
+        单个任务失败不会中断整个批次，失败信息记录在对应结果中。
+
+        Args:
+            jobs: 任务清单，每项包含 chart_type、data、data_type、title、theme、
+                  data_format、significant_digits、precision、optimize、
+                  output (config/html)、height 和可选的 id
+            output_dir: 输出目录，指定后结果写入文件，返回值只包含文件路径
+            max_workers: 最大进程数，不超过 settings.BATCH_MAX_WORKERS（为空时为 CPU 核数）
+            chunk_size: 每次提交给进程池的任务数，默认使用 settings.BATCH_CHUNK_SIZE
+            on_progress: 进度回调，参数为 (已完成数, 总数, 失败数)
+
+        Returns:
+            任务结果迭代器，提前关闭时取消尚未开始的任务
+        """
+        total = len(jobs)
+        if total == 0:
+            return
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        chunk_size = max(1, chunk_size or settings.BATCH_CHUNK_SIZE)
+        # 进程数由服务器配置封顶，也不超过任务组数，客户端无法要求任意多的进程
+        limit = settings.BATCH_MAX_WORKERS or os.cpu_count() or 1
+        max_workers = max(1, min(max_workers or limit, limit, math.ceil(total / chunk_size)))
+
+        done = 0
+        failed = 0
+        # spawn 避免在多线程的服务进程中 fork
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            futures = {}
+            for start in range(0, total, chunk_size):
+                chunk = jobs[start:start + chunk_size]
+                future = executor.submit(_run_chunk, chunk, start, output_dir)
+                futures[future] = (start, chunk)
+
+            for future in as_completed(futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    # 工作进程异常退出时，将该组任务全部标记为失败
+                    start, chunk = futures[future]
+                    results = [
+                        {
+                            "id": str(job.get("id", start + i)),
+                            "index": start + i,
+                            "status": "error",
+                            "error": f"工作进程执行失败: {str(e)}"
+                        }
+                        for i, job in enumerate(chunk)
+                    ]
+
+                for result in results:
+                    done += 1
+                    if result["status"] != "success":
+                        failed += 1
+                    if on_progress:
+                        on_progress(done, total, failed)
+                    yield result
+        finally:
+            # 迭代器被提前关闭（如客户端断开）时取消尚未开始的任务，不等待正在执行的任务
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def stream_ndjson(cls, jobs: List[Dict[str, Any]], output_dir: Optional[str] = None,
+                      max_workers: Optional[int] = None, chunk_size: Optional[int] = None) -> Iterator[str]:
+        """
+        以 NDJSON 格式流式输出批量结果
+
+        每行是一个任务结果，附带当前进度；最后一行为汇总信息。
+
+        Args:
+            jobs: 任务清单
+            output_dir: 输出目录
+            max_workers: 最大进程数
+            chunk_size: 每次提交给进程池的任务数
+
+        Returns:
+            NDJSON 行迭代器
+        """
+        total = len(jobs)
+        succeeded = 0
+        failed = 0
+        started_at = time.perf_counter()
+
+        for result in cls.run(jobs, output_dir, max_workers, chunk_size):
+            if result["status"] == "success":
+                succeeded += 1
+            else:
+                failed += 1
+            line = {
+                "type": "result",
+                "progress": {"done": succeeded + failed, "total": total, "failed": failed},
+                **result
+            }
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+        summary = {
+            "type": "summary",
+            "total": total,
+            "succeeded": succeeded,
+            "failed": failed,
+            "elapsed": round(time.perf_counter() - started_at, 3)
+        }
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
@@ -0,0 +1,122 @@
+"""
+浏览器端渲染基准测试
+
+生成一个 HTML 页面，分别用原始配置和 optimize_config 优化后的配置渲染不同数据量的图表，
+在浏览器中记录从 setOption 到 ECharts finished 事件的耗时。
+
+用法:
+    python benchmarks/render_bench.py [--sizes 1000,10000,100000,200000] [--output render_bench.html] [--open]
+"""
+import argparse
+import copy
+import json
+import math
+import os
+import sys
+import webbrowser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from echarts_utils import EChartsUtils
+
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <title>ECharts 渲染基准测试</title>
+    <script src="https://cdn.jsdelivr.net/npm/echarts@{echarts_version}/dist/echarts.min.js"></script>
+    <style>
+        body {{ font-family: sans-serif; margin: 20px; }}
+        #chart {{ width: 100%; height: 400px; }}
+        table {{ border-collapse: collapse; margin-top: 20px; }}
+        td, th {{ border: 1px solid #ccc; padding: 4px 12px; text-align: right; }}
+    </style>
+</head>
+<body>
+    <h3>ECharts 渲染基准测试</h3>
+    <div id="chart"></div>
+    <table>
+        <thead><tr><th>用例</th><th>数据点数</th><th>原始配置 (ms)</th><th>优化配置 (ms)</th></tr></thead>
+        <tbody id="results"></tbody>
+    </table>
+    <script>
+        var cases = {cases};
+        var container = document.getElementById('chart');
+
+        // 渲染一次并返回从 setOption 到 finished 事件的耗时
+        function measure(option) {{
+            return new Promise(function (resolve) {{
+                var chart = echarts.init(container);
+                var start = performance.now();
+                chart.on('finished', function () {{
+                    var elapsed = performance.now() - start;
+                    chart.dispose();
+                    resolve(elapsed);
+                }});
+                chart.setOption(option);
+            }});
+        }}
+
+        async function run() {{
+            var tbody = document.getElementById('results');
+            for (var i = 0; i < cases.length; i++) {{
+                var c = cases[i];
+                var raw = await measure(c.raw);
+                var optimized = await measure(c.optimized);
+                var row = document.createElement('tr');
+                row.innerHTML = '<td>' + c.name + '</td><td>' + c.points + '</td><td>' +
+                    raw.toFixed(1) + '</td><td>' + optimized.toFixed(1) + '</td>';
+                tbody.appendChild(row);
+                console.log(c.name, c.points, raw.toFixed(1), optimized.toFixed(1));
+            }}
+        }}
+        run();
+    </script>
+</body>
+</html>
+'''
+
+
+def build_case(chart_type: str, size: int) -> dict:
+    """构造一个测试用例：原始配置和优化后的配置"""
+    if chart_type == "scatter":
+        data = {"series": [{"name": "points", "data": [[i, math.sin(i / 50) * 100 + (i % 7)] for i in range(size)]}]}
+    else:
+        data = {
+            "xAxis": [str(i) for i in range(size)],
+            "series": [{"name": "value", "data": [round(math.sin(i / 50) * 100 + (i % 7), 2) for i in range(size)]}]
+        }
+
+    raw = EChartsUtils.create_chart_config(chart_type, data, f"{chart_type} {size}")
+    raw["animation"] = True
+    optimized = EChartsUtils.optimize_config(copy.deepcopy(raw))
+    return {"name": chart_type, "points": size, "raw": raw, "optimized": optimized}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="浏览器端渲染基准测试")
+    parser.add_argument("--sizes", default="1000,10000,100000,200000", help="数据点数，逗号分隔")
+    parser.add_argument("--types", default="line,bar,scatter", help="图表类型，逗号分隔")
+    parser.add_argument("--output", default="render_bench.html", help="输出 HTML 文件")
+    parser.add_argument("--open", action="store_true", help="生成后在浏览器中打开")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    cases = [build_case(chart_type, size) for chart_type in args.types.split(",") for size in sizes]
+
+    html = PAGE_TEMPLATE.format(
+        echarts_version=settings.ECHARTS_VERSION,
+        cases=json.dumps(cases, ensure_ascii=False)
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(html)
+    print(f"已生成 {args.output}，在浏览器中打开即可查看渲染耗时")
+
+    if args.open:
+        webbrowser.open(f"file://{os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+服务器冷启动基准测试
+
+在独立子进程中多次导入 server 模块，统计导入耗时、首次工具调用耗时以及空闲进程的常驻内存。
+
+用法:
+    python benchmarks/startup_bench.py [--runs 10] [--prewarm]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行的测量脚本
+CHILD_SCRIPT = r'''
+import json, resource, sys, time
+t0 = time.perf_counter()
+import server
+t1 = time.perf_counter()
+rss_idle = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if "--prewarm" in sys.argv:
+    server.prewarm()
+t2 = time.perf_counter()
+server.create_chart("line", {"xAxis": ["1月", "2月"], "series": [{"data": [1, 2]}]}, "收入")
+server.process_data("month,sales\n1月,100\n2月,200", "csv", "bar")
+t3 = time.perf_counter()
+print(json.dumps({
+    "import": t1 - t0,
+    "prewarm": t2 - t1,
+    "first_response": t3 - t2,
+    "rss_idle_kb": rss_idle,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+'''
+
+
+def run_once(prewarm: bool) -> dict:
+    """启动一个子进程并返回测量结果"""
+    args = [sys.executable, "-c", CHILD_SCRIPT]
+    if prewarm:
+        args.append("--prewarm")
+    output = subprocess.check_output(args, cwd=PROJECT_ROOT)
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="服务器冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=10, help="重复次数")
+    parser.add_argument("--prewarm", action="store_true", help="导入后先执行 server.prewarm()")
+    args = parser.parse_args()
+
+    samples = [run_once(args.prewarm) for _ in range(args.runs)]
+
+    for key, unit, scale in (
+        ("import", "ms", 1000),
+        ("prewarm", "ms", 1000),
+        ("first_response", "ms", 1000),
+        ("rss_idle_kb", "MB", 1 / 1024),
+        ("rss_kb", "MB", 1 / 1024),
+    ):
+        values = [s[key] * scale for s in samples]
+        print(f"{key:16s} median={statistics.median(values):8.1f} {unit}  "
+              f"min={min(values):8.1f} {unit}  max={max(values):8.1f} {unit}")
+
+
+if __name__ == "__main__":
+    main()
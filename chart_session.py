@@ -0,0 +1,220 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+from config import settings
+
+
+# 骨架中替代数据数组的占位符前缀
+DATA_REF_PREFIX = "@data:"
+
+# 存放数据的字段名
+_DATA_KEYS = ("data", "source")
+
+
+def strip_data(config: Any, path: str = "") -> Tuple[Any, Dict[str, Any]]:
+    """
+    把配置中的数据数组替换为占位符，得到只描述结构和样式的骨架
+
+    data 和 source 字段中超过 REFINE_INLINE_LIST_LIMIT 个元素的数组被替换为 "@data:<路径>"，
+    较短的数组（如 legend.data、markLine.data）保持原样，便于模型理解。
+
+    Args:
+        config: 图表配置
+        path: 当前位置的路径
+
+    Returns:
+        (骨架, 占位符到数据数组的映射)
+    """
+    refs: Dict[str, Any] = {}
+
+    def walk(value: Any, path: str) -> Any:
+        if isinstance(value, dict):
+            result = {}
+            for key, item in value.items():
+                item_path = f"{path}.{key}" if path else key
+                if key in _DATA_KEYS and isinstance(item, (list, dict)) and len(item) > settings.REFINE_INLINE_LIST_LIMIT:
+                    ref = DATA_REF_PREFIX + item_path
+                    refs[ref] = item
+                    result[key] = ref
+                else:
+                    result[key] = walk(item, item_path)
+            return result
+        if isinstance(value, list):
+            return [walk(item, f"{path}[{i}]") for i, item in enumerate(value)]
+        return value
+
+    return walk(config, path), refs
+
+
+def resolve_data_refs(patch: Any, refs: Dict[str, Any]) -> Any:
+    """
+    把补丁中的占位符还原为数据数组
+
+    Args:
+        patch: 模型返回的补丁
+        refs: strip_data 返回的占位符映射
+
+    Returns:
+        还原后的补丁
+
+    Raises:
+        ValueError: 补丁引用了不存在的占位符
+    """
+    if isinstance(patch, str) and patch.startswith(DATA_REF_PREFIX):
+        if patch not in refs:
+            raise ValueError(f"补丁引用了不存在的数据: {patch}")
+        return refs[patch]
+    if isinstance(patch, dict):
+        return {key: resolve_data_refs(value, refs) for key, value in patch.items()}
+    if isinstance(patch, list):
+        return [resolve_data_refs(item, refs) for item in patch]
+    return patch
+
+
+def apply_merge_patch(target: Any, patch: Any) -> Any:
+    """
+    应用 JSON Merge Patch (RFC 7396)
+
+    只复制补丁涉及的路径，未修改的子树（包括数据数组）与原配置共享，
+    因此保存多个版本不会复制数据。
+
+    Args:
+        target: 原配置，不会被修改
+        patch: 补丁，值为 null 的字段被删除，数组整体替换
+
+    Returns:
+        新配置
+    """
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+class ChartSessionStore:
+    """图表会话：按版本保存同一图表的每次修改，超过数量或过期的会话被淘汰"""
+
+    def __init__(self, max_sessions: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        初始化会话存储
+
+        Args:
+            max_sessions: 最大会话数，默认使用 settings.CHART_SESSION_MAX
+            ttl: 会话闲置多少秒后过期，默认使用 settings.CHART_SESSION_TTL
+        """
+        # 默认值在使用时才读取，模块级实例不会在导入时创建 Settings
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, config: Dict[str, Any]) -> Tuple[str, int]:
+        """
+        新建会话，config 作为版本 0
+
+        Args:
+            config: 初始图表配置
+
+        Returns:
+            (会话 ID, 版本号)
+        """
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._evict()
+            self._sessions[session_id] = {
+                "versions": [{"version": 0, "config": config, "instruction": None, "patch": None}],
+                "next_version": 1,
+                "updated_at": time.monotonic()
+            }
+            max_sessions = self.max_sessions or settings.CHART_SESSION_MAX
+            while len(self._sessions) > max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id, 0
+
+    def get(self, session_id: str, version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        获取会话中的某个版本
+
+        Args:
+            session_id: 会话 ID
+            version: 版本号，默认为最新版本
+
+        Returns:
+            版本记录，包含 version、config、instruction 和 patch
+
+        Raises:
+            KeyError: 会话或版本不存在
+        """
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise KeyError(f"图表会话不存在或已过期: {session_id}")
+            self._sessions.move_to_end(session_id)
+            session["updated_at"] = time.monotonic()
+            versions = session["versions"]
+            if version is None:
+                return versions[-1]
+            for record in versions:
+                if record["version"] == version:
+                    return record
+            raise KeyError(f"图表会话 {session_id} 中没有版本 {version}")
+
+    def commit(self, session_id: str, config: Dict[str, Any], instruction: str,
+               patch: Dict[str, Any]) -> int:
+        """
+        保存新版本，超过 CHART_SESSION_MAX_VERSIONS 时丢弃最早的版本
+
+        Args:
+            session_id: 会话 ID
+            config: 新配置
+            instruction: 本次修改的指令
+            patch: 本次应用的补丁
+
+        Returns:
+            新版本号
+
+        Raises:
+            KeyError: 会话不存在
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise KeyError(f"图表会话不存在或已过期: {session_id}")
+            version = session["next_version"]
+            session["next_version"] += 1
+            session["versions"].append({
+                "version": version, "config": config, "instruction": instruction, "patch": patch
+            })
+            del session["versions"][:-settings.CHART_SESSION_MAX_VERSIONS]
+            session["updated_at"] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return version
+
+    def history(self, session_id: str) -> List[Dict[str, Any]]:
+        """返回会话中各版本的指令和补丁（不含配置）"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise KeyError(f"图表会话不存在或已过期: {session_id}")
+            return [
+                {"version": record["version"], "instruction": record["instruction"], "patch": record["patch"]}
+                for record in session["versions"]
+            ]
+
+    def _evict(self) -> None:
+        """淘汰过期会话（需持有锁）"""
+        deadline = time.monotonic() - (self.ttl or settings.CHART_SESSION_TTL)
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session["updated_at"] >= deadline:
+                break
+            self._sessions.popitem(last=False)
@@ -0,0 +1,239 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+import anyio
+
+from config import settings
+
+
+# 可压缩的内容类型
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/x-ndjson", "image/svg+xml")
+
+def _load_brotli():
+    """brotli 为可选依赖，未安装时返回 None"""
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _load_zstd():
+    """zstandard 为可选依赖，未安装时返回 None"""
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def available_encodings() -> List[str]:
+    """返回当前环境支持的压缩编码，按服务端偏好排序（压缩率和速度更好的编码优先）"""
+    encodings = []
+    if _load_zstd() is not None:
+        encodings.append("zstd")
+    if _load_brotli() is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def choose_encoding(accept_encoding: str, supported: Optional[List[str]] = None) -> Optional[str]:
+    """
+    根据 Accept-Encoding 协商压缩编码
+
+    Args:
+        accept_encoding: 请求头 Accept-Encoding 的值
+        supported: 服务端支持的编码，默认为 available_encodings()
+
+    Returns:
+        选中的编码，不需要压缩时返回 None
+    """
+    if not accept_encoding:
+        return None
+    supported = supported if supported is not None else available_encodings()
+
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        fields = part.strip().split(";")
+        name = fields[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best = None
+    best_q = 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    按指定编码压缩，压缩级别来自配置
+
+    Args:
+        body: 原始内容
+        encoding: zstd、br 或 gzip
+
+    Returns:
+        压缩后的内容
+    """
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return _load_brotli().compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    if encoding == "zstd":
+        return _load_zstd().ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compress(body)
+    raise ValueError(f"不支持的压缩编码: {encoding}")
+
+
+class CompressionCache:
+    """压缩结果缓存：内容相同的输出只压缩一次，按总字节数做 LRU 淘汰"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 缓存的压缩内容总字节数上限，默认使用 settings.COMPRESSION_CACHE_BYTES
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compress(self, body: bytes, encoding: str) -> bytes:
+        """
+        返回缓存的压缩结果，未命中时压缩并缓存
+
+        Args:
+            body: 原始内容
+            encoding: 压缩编码
+
+        Returns:
+            压缩后的内容
+        """
+        key = (hashlib.blake2b(body, digest_size=20).digest(), encoding)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        compressed = compress(body, encoding)
+        max_bytes = self.max_bytes if self.max_bytes is not None else settings.COMPRESSION_CACHE_BYTES
+        if len(compressed) > max_bytes:
+            return compressed
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = compressed
+                self._size += len(compressed)
+                while self._size > max_bytes:
+                    _, old = self._entries.popitem(last=False)
+                    self._size -= len(old)
+        return compressed
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+class CompressionMiddleware:
+    """
+    响应压缩中间件（ASGI）
+
+    按 Accept-Encoding 协商 zstd/br/gzip，只压缩一次性返回、达到最小长度的文本类响应，
+    流式响应（如 /batch 的 NDJSON）保持原样以免缓冲。
+    """
+
+    def __init__(self, app, cache: Optional[CompressionCache] = None):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        cache = self.cache
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = start_message.get("headers", [])
+            content_type = ""
+            already_encoded = False
+            for name, value in headers:
+                if name == b"content-type":
+                    content_type = value.decode("latin-1").lower()
+                elif name == b"content-encoding":
+                    already_encoded = True
+
+            if (message.get("more_body", False) or already_encoded
+                    or len(body) < settings.COMPRESSION_MIN_SIZE
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                # 不压缩：原样转发
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compress_body = cache.get_or_compress if cache is not None else compress
+            if len(body) >= settings.COMPRESSION_THREAD_MIN_SIZE:
+                # 大响应的压缩耗时可达数十毫秒，放到线程池中执行，避免阻塞其他请求
+                compressed = await anyio.to_thread.run_sync(compress_body, body, encoding)
+            else:
+                compressed = compress_body(body, encoding)
+            vary = [value for name, value in headers if name == b"vary"]
+            new_headers = [
+                (name, value) for name, value in headers
+                if name not in (b"content-length", b"vary")
+            ]
+            new_headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+                (b"vary", b", ".join(vary + [b"Accept-Encoding"])),
+            ]
+            await send({**start_message, "headers": new_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
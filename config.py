@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Any
 import os
 
 
@@ -14,12 +15,103 @@ class Settings(BaseSettings):
     DEEPSEEK_API_KEY: Optional[str] = None
     DEEPSEEK_API_URL: str = "https://api.deepseek.com/v1/chat/completions"
     DEEPSEEK_MODEL: str = "deepseek-chat"  # can be changed to deepseek-reasoner
+    DEEPSEEK_TIMEOUT: int = 30  # 请求超时（秒）
+    JSON_REPAIR_MAX_RETRIES: int = 1  # 输出无法解析时请求模型修正的次数
+    JSON_REPAIR_CONTEXT_CHARS: int = 200  # 修正请求发送出错位置前后各多少个字符
+    JSON_REPAIR_MAX_TOKENS: int = 512  # 修正请求的 max_tokens
+    PROMPT_SIGNIFICANT_DIGITS: Optional[int] = None  # 发送给模型的数据保留的有效数字位数，为空时不量化
+    
+    # 模型路由与 max_tokens 预算配置
+    MODEL_ROUTING_ENABLED: bool = True  # 关闭时固定使用 DEEPSEEK_MODEL、max_tokens=2048
+    DEEPSEEK_REASONER_MODEL: str = "deepseek-reasoner"
+    DEEPSEEK_REASONER_TIMEOUT: int = 180
+    DEEPSEEK_CHAT_MAX_TOKENS: int = 8192  # deepseek-chat 输出上限
+    DEEPSEEK_REASONER_MAX_TOKENS: int = 32768  # deepseek-reasoner 输出上限（包含思维链）
+    MODEL_ROUTING_COMPLEXITY_THRESHOLD: int = 2  # 复杂度达到该值时使用推理模型
+    MIN_MAX_TOKENS: int = 512
+    REASONER_THINKING_TOKENS: int = 4096  # 为推理模型思维链预留的 token 数
+    TOKEN_ESTIMATE_CHARS_PER_TOKEN: float = 3.0  # 数据 JSON 每个 token 的平均字符数
+    TOKEN_ESTIMATE_SKELETON: int = 300  # 配置骨架（标题、坐标轴、样式等）的 token 数
+    TOKEN_ESTIMATE_PER_SERIES: int = 60
+    TOKEN_ESTIMATE_SAFETY_FACTOR: float = 1.3
+    TOKEN_ESTIMATE_LEARNING_RATE: float = 0.2  # 根据实际 usage 修正估计的速度
+    
+    # 上游调用准入控制配置
+    LLM_MAX_CONCURRENCY: int = 8  # 同时进行的 DeepSeek 调用数上限
+    LLM_RPM_LIMIT: Optional[int] = None  # 账号每分钟请求数上限，为空时不限制
+    LLM_TPM_LIMIT: Optional[int] = None  # 账号每分钟 token 数上限，为空时不限制
+    LLM_QUEUE_TIMEOUT_INTERACTIVE: float = 15.0  # 交互调用最长排队时间（秒）
+    LLM_QUEUE_TIMEOUT_BATCH: float = 120.0  # 批量任务最长排队时间（秒）
+    # 各优先级同时排队等待的调用数上限，每个排队调用占用一个线程池线程，两者之和应小于线程池大小（默认 40）
+    LLM_MAX_QUEUED_INTERACTIVE: int = 16
+    LLM_MAX_QUEUED_BATCH: int = 8
+    
+    # 图表会话与增量修改配置
+    CHART_SESSION_MAX: int = 200  # 最多保存的图表会话数
+    CHART_SESSION_TTL: int = 3600  # 会话闲置多少秒后过期
+    CHART_SESSION_MAX_VERSIONS: int = 50  # 每个会话保留的版本数
+    REFINE_MAX_TOKENS: int = 1024  # refine_chart 补丁的最大 token 数
+    REFINE_INLINE_LIST_LIMIT: int = 10  # 元素不超过该数量的 data 数组直接发送给模型，否则替换为占位符
+    
+    # 规则路由配置
+    INTENT_ROUTER_ENABLED: bool = True
+    INTENT_ROUTER_MIN_CONFIDENCE: float = 0.8  # 本地规则能解释的提示词比例
+    
+    # 相似提示缓存配置
+    PROMPT_CACHE_ENABLED: bool = True
+    PROMPT_CACHE_THRESHOLD: float = 0.8  # 相似度阈值（不同的词按两倍计入的 Jaccard）
+    PROMPT_CACHE_SIZE: int = 1000
     
     # ECharts 配置
     ECHARTS_VERSION: str = "5.4.3"
+    LARGE_DATA_THRESHOLD: int = 2000  # series 数据点数超过该值时开启大数据渲染
+    PROGRESSIVE_CHUNK_SIZE: int = 5000  # 渐进渲染每帧绘制的数据点数
+    DATAZOOM_CATEGORY_THRESHOLD: int = 100  # 类目数超过该值时添加 dataZoom
+    CHART_DATA_FORMAT: str = "series"  # 数据输出格式: series（写入每个 series.data）或 dataset（共享列式 dataset.source）
+    CHART_SIGNIFICANT_DIGITS: Optional[int] = None  # 数值保留的有效数字位数，为空时不量化
     
     # 数据处理配置
     MAX_DATA_SIZE: int = 10000
+    MAX_REQUEST_BYTES: int = 100 * 1024 * 1024  # /call 请求体字节数上限
+    MAX_FIELD_BYTES: int = 50 * 1024 * 1024  # 单个工具参数的字节数上限
+    REQUEST_PARSE_CHUNK_BYTES: int = 1024 * 1024  # 增量解析请求体时每次处理的字节数
+    PIE_MAX_SLICES: Optional[int] = None  # 未指定 top_n 时饼图最多保留的扇区数，超出部分合并为“其他”，为空时不合并
+    SCATTER_GRID_SIZE: int = 100  # 散点分箱/分层采样时每个坐标轴上的格子数
+    SCATTER_SAMPLE_SIZE: int = 5000  # 散点分层采样保留的点数
+    SCATTER_OUTLIER_Z: float = 3.5  # 稳健 z 分数超过该值的点视为离群点，采样时全部保留
+    
+    # 数据处理进程池配置
+    DATA_WORKER_ENABLED: bool = True  # 是否把重量级数据解析放到常驻工作进程中执行
+    DATA_WORKER_MAX_WORKERS: int = 2  # 工作进程数
+    DATA_WORKER_MIN_BYTES: int = 256 * 1024  # 字符串数据达到该长度（或 Excel 数据）时才交给工作进程
+    DATA_JOB_TIMEOUT: float = 60.0  # 单个数据处理任务的超时秒数（含排队），超时后终止工作进程
+    DATA_WORKER_SHM_MIN_ITEMS: int = 1024  # 数值数组达到该长度时通过共享内存传回
+    
+    # 数据概况与坐标轴配置
+    DATA_PROFILE_CACHE_SIZE: int = 256  # 按内容哈希缓存的数据概况数量
+    AXIS_AUTO_SCALE_ENABLED: bool = True  # optimize_chart 是否根据数据概况调整坐标轴类型和范围
+    AXIS_LOG_SCALE_RATIO: float = 1000.0  # 数值全为正且最大值与最小值之比达到该值时使用对数轴
+    AXIS_SCALE_MIN_RATIO: float = 0.5  # 折线图和散点图的数值同号且绝对值的最小/最大之比达到该值时不强制包含 0
+    
+    # 批量生成配置
+    BATCH_MAX_WORKERS: Optional[int] = None  # 为空时使用 CPU 核数
+    BATCH_CHUNK_SIZE: int = 50
+    BATCH_OUTPUT_ROOT: str = "batch_output"  # /batch 的 output_dir 必须位于该目录之下（相对路径按该目录解析）
+    
+    # 响应压缩配置（br 需要安装 brotli，zstd 需要安装 zstandard）
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # 小于该字节数的响应不压缩
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_CACHE_BYTES: int = 64 * 1024 * 1024  # 压缩结果缓存的总字节数上限
+    COMPRESSION_THREAD_MIN_SIZE: int = 256 * 1024  # 达到该字节数的响应在线程池中压缩，不阻塞事件循环
+    
+    # stdio 传输配置
+    STDIO_MAX_WORKERS: int = 8
+    
+    # 启动配置
+    PREWARM: bool = False  # 启动后在后台预加载 pandas 和 DeepSeek 客户端
     
     class Config:
         # 从项目根目录读取 .env 文件
@@ -27,5 +119,18 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
 
 
-# 创建全局配置实例
-settings = Settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """获取全局配置实例，首次调用时才读取环境变量和 .env 文件"""
+    return Settings()
+
+
+class _LazySettings:
+    """延迟创建的配置代理，首次访问属性时才实例化 Settings"""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
+
+
+# 全局配置实例
+settings = _LazySettings()
@@ -1,12 +1,30 @@
+import hashlib
+import heapq
 import json
-import pandas as pd
-from typing import Dict, Any, Optional, List
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple
 from config import settings
 
 
+# 六边形符号（ECharts path 符号），用于六边形分箱的热力展示
+_HEXAGON_SYMBOL = "path://M0,-1L0.866,-0.5L0.866,0.5L0,1L-0.866,0.5L-0.866,-0.5Z"
+
+# 数据概况中视为空值的字符串（CSV 的 x 列经 astype(str) 后空值变为 "nan"）
+_NULL_STRINGS = frozenset({"", "nan", "NaN", "None", "null", "NaT"})
+
+
 class DataProcessor:
     """数据处理模块"""
     
+    # 按内容哈希缓存的数据概况
+    _profile_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    _profile_lock = threading.Lock()
+    _profile_hits = 0
+    _profile_misses = 0
+    
     @classmethod
     def process_data(cls, data: Any, data_type: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -86,6 +104,8 @@ class DataProcessor:
             处理后的数据，格式为 {"xAxis": [...], "series": [{"data": [...]}]}
         """
         import io
+        # 延迟导入 pandas，避免拖慢服务器启动
+        import pandas as pd
         
         # 读取 CSV 数据
         df = pd.read_csv(io.StringIO(data))
@@ -127,6 +147,8 @@ class DataProcessor:
         Returns:
             处理后的数据
         """
+        import pandas as pd
+        
         # 读取 Excel 数据
         df = pd.read_excel(data)
         
@@ -234,31 +256,291 @@ class DataProcessor:
             return sum(numeric_data)
     
     @classmethod
-    def format_for_echarts(cls, data: Dict[str, Any], chart_type: str) -> Dict[str, Any]:
+    def profile_data(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        计算数据集概况，按内容哈希缓存
+        
+        对 x 列（类目或散点的横坐标）和各 series 的数值列各扫描一遍，得到类型、
+        最小/最大值、空值数、基数和单调性，并识别日期时间和以字符串保存的数值。
+        EChartsUtils.optimize_config 据此选择坐标轴类型和范围，不必再扫描原始数据。
+        
+        Args:
+            data: process_data/format_for_echarts 的输出，包含 xAxis 和 series（饼图为 data）
+            
+        Returns:
+            数据概况，包含 hash、x、y（所有 series 数值的汇总）和 series（逐个 series 的 x/y 列概况）
+        """
+        content = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+        key = hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+        with cls._profile_lock:
+            cached = cls._profile_cache.get(key)
+            if cached is not None:
+                cls._profile_cache.move_to_end(key)
+                cls._profile_hits += 1
+                return cached
+            cls._profile_misses += 1
+        
+        profile = {"hash": key, **cls._build_profile(data)}
+        with cls._profile_lock:
+            cls._profile_cache[key] = profile
+            while len(cls._profile_cache) > settings.DATA_PROFILE_CACHE_SIZE:
+                cls._profile_cache.popitem(last=False)
+        return profile
+    
+    @classmethod
+    def profile_cache_stats(cls) -> Dict[str, Any]:
+        """返回数据概况缓存的命中统计"""
+        with cls._profile_lock:
+            return {"entries": len(cls._profile_cache), "hits": cls._profile_hits, "misses": cls._profile_misses}
+    
+    @classmethod
+    def _build_profile(cls, data: Any) -> Dict[str, Any]:
+        """计算 x 列和各 series 列的概况"""
+        if not isinstance(data, dict):
+            data = {}
+        x_values = data.get("xAxis")
+        if isinstance(x_values, dict):
+            x_values = x_values.get("data")
+        series_list = data.get("series")
+        if isinstance(series_list, dict):
+            series_list = [series_list]
+        if series_list is None and isinstance(data.get("data"), list):
+            series_list = [{"data": data["data"]}]
+        
+        series_profiles = []
+        for series in series_list if isinstance(series_list, list) else []:
+            values = series.get("data") if isinstance(series, dict) else None
+            name = series.get("name") if isinstance(series, dict) else None
+            if not isinstance(values, list):
+                series_profiles.append({"name": name, "x": None, "y": None})
+                continue
+            xs, ys = cls._split_values(values)
+            series_profiles.append({
+                "name": name,
+                "x": cls._profile_column(xs) if xs is not None else None,
+                "y": cls._profile_column(ys)
+            })
+        
+        if isinstance(x_values, list):
+            x_profile = cls._profile_column(x_values)
+        else:
+            x_profile = cls._merge_columns([p["x"] for p in series_profiles if p["x"]])
+        return {
+            "x": x_profile,
+            "y": cls._merge_columns([p["y"] for p in series_profiles if p["y"]]),
+            "series": series_profiles
+        }
+    
+    @staticmethod
+    def _split_values(values: List[Any]) -> Tuple[Optional[List[Any]], List[Any]]:
+        """把 series 数据拆分为 x 列和数值列，标量数组没有 x 列"""
+        first = next((v for v in values if v is not None), None)
+        if isinstance(first, (list, tuple)):
+            # 散点 [x, y, ...]
+            xs = [v[0] if isinstance(v, (list, tuple)) and len(v) > 1 else None for v in values]
+            ys = [v[1] if isinstance(v, (list, tuple)) and len(v) > 1 else None for v in values]
+            return xs, ys
+        if isinstance(first, dict):
+            # 饼图 {"name", "value"} 或带样式的数据项
+            return None, [v.get("value") if isinstance(v, dict) else v for v in values]
+        return None, values
+    
+    @staticmethod
+    def _profile_column(values: List[Any]) -> Dict[str, Any]:
+        """
+        计算单列的概况
+        
+        只用标准库逐值扫描一遍，不导入 pandas/numpy，规则路由和 optimize_chart 不会因此承担导入开销。
+        
+        Args:
+            values: 列数据
+            
+        Returns:
+            概况，dtype 为 number、datetime、string、boolean 或 empty；
+            日期时间的 min/max 为毫秒时间戳（不含时区的按 UTC 计算，只用于比较和判断间距）
+        """
+        nulls = 0
+        numbers: List[float] = []
+        texts: List[str] = []
+        booleans = 0
+        for value in values:
+            if value is None or (isinstance(value, str) and value.strip() in _NULL_STRINGS):
+                nulls += 1
+            elif isinstance(value, bool):
+                booleans += 1
+                texts.append(str(value))
+            elif isinstance(value, (int, float)):
+                # NaN 和无穷大无法作为坐标轴范围，按空值计
+                if isinstance(value, float) and not math.isfinite(value):
+                    nulls += 1
+                else:
+                    numbers.append(value)
+            else:
+                texts.append(str(value).strip())
+        
+        profile = {
+            "dtype": "empty",
+            "count": len(values),
+            "nulls": nulls,
+            "distinct": len(set(numbers)) + len(set(texts)),
+            "min": None,
+            "max": None,
+            "monotonic": None,
+            "evenly_spaced": False,
+            "integer": False
+        }
+        if not numbers and not texts:
+            return profile
+        if booleans:
+            profile["dtype"] = "boolean" if booleans == len(numbers) + len(texts) else "string"
+            return profile
+        
+        if texts:
+            # 以字符串保存的数值（如 CSV 的 x 列）
+            parsed = DataProcessor._parse_numbers(texts)
+            if parsed is None:
+                profile["dtype"] = "string"
+                times = DataProcessor._parse_datetimes(texts) if not numbers else None
+                if times is not None:
+                    profile.update({"dtype": "datetime", "min": min(times), "max": max(times)})
+                    profile.update(DataProcessor._ordering(times))
+                return profile
+            if numbers:
+                # 数值和数值字符串混在一起时无法还原原始顺序，只统计范围
+                numbers = numbers + parsed
+                profile["distinct"] = len(set(numbers))
+            else:
+                numbers = parsed
+        
+        integer = all(float(v).is_integer() for v in numbers)
+        low, high = min(numbers), max(numbers)
+        profile.update({
+            "dtype": "number",
+            "min": int(low) if integer else float(low),
+            "max": int(high) if integer else float(high),
+            "integer": integer
+        })
+        if len(numbers) == len(values) - nulls:
+            profile.update(DataProcessor._ordering(numbers))
+        return profile
+    
+    @staticmethod
+    def _parse_numbers(texts: List[str]) -> Optional[List[float]]:
+        """把字符串全部解析为有限数值，任意一个失败时返回 None"""
+        numbers = []
+        for text in texts:
+            try:
+                number = float(text)
+            except ValueError:
+                return None
+            if not math.isfinite(number):
+                return None
+            numbers.append(number)
+        return numbers
+    
+    @staticmethod
+    def _parse_datetimes(texts: List[str]) -> Optional[List[int]]:
+        """把 ISO 8601 日期时间字符串（允许用 / 分隔日期）解析为毫秒时间戳，任意一个失败时返回 None"""
+        times = []
+        for text in texts:
+            # 不含数字的文本（如月份名、星期）不是日期
+            if not any(c.isdigit() for c in text):
+                return None
+            try:
+                moment = datetime.fromisoformat(text.replace("/", "-"))
+            except ValueError:
+                return None
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            times.append(int(moment.timestamp() * 1000))
+        return times
+    
+    @staticmethod
+    def _ordering(values: List[float]) -> Dict[str, Any]:
+        """判断数值序列的单调性以及相邻值的间距是否相等"""
+        if len(values) < 2:
+            return {"monotonic": None, "evenly_spaced": False}
+        diffs = [b - a for a, b in zip(values, values[1:])]
+        if all(d >= 0 for d in diffs):
+            monotonic = "increasing"
+        elif all(d <= 0 for d in diffs):
+            monotonic = "decreasing"
+        else:
+            return {"monotonic": None, "evenly_spaced": False}
+        step = diffs[0]
+        evenly_spaced = step != 0 and all(abs(d - step) <= abs(step) * 1e-6 for d in diffs)
+        return {"monotonic": monotonic, "evenly_spaced": evenly_spaced}
+    
+    @staticmethod
+    def _merge_columns(profiles: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """汇总多列的概况，单调性和基数无法由各列推出，置为空"""
+        if not profiles:
+            return None
+        if len(profiles) == 1:
+            return profiles[0]
+        dtypes = {p["dtype"] for p in profiles if p["dtype"] != "empty"}
+        dtype = dtypes.pop() if len(dtypes) == 1 else ("mixed" if dtypes else "empty")
+        bounds = dtype in ("number", "datetime")
+        return {
+            "dtype": dtype,
+            "count": sum(p["count"] for p in profiles),
+            "nulls": sum(p["nulls"] for p in profiles),
+            "distinct": None,
+            "min": min(p["min"] for p in profiles if p["min"] is not None) if bounds else None,
+            "max": max(p["max"] for p in profiles if p["max"] is not None) if bounds else None,
+            "monotonic": None,
+            "evenly_spaced": False,
+            "integer": all(p["integer"] for p in profiles if p["dtype"] != "empty")
+        }
+    
+    @classmethod
+    def format_for_echarts(cls, data: Dict[str, Any], chart_type: str,
+                           top_n: Optional[int] = None, sort: Optional[str] = None,
+                           merge_duplicates: bool = False, other_label: str = "其他",
+                           reduction: Optional[str] = None, bin_shape: str = "square",
+                           bin_output: str = "bubble", grid_size: Optional[int] = None,
+                           sample_size: Optional[int] = None) -> Dict[str, Any]:
         """
         格式化数据为 ECharts 所需格式
         
         Args:
             data: 原始数据
             chart_type: 图表类型
+            top_n: 饼图保留的最大扇区数，其余合并为 other_label，默认使用 settings.PIE_MAX_SLICES（为空时不合并）
+            sort: 饼图扇区排序 (desc, asc)，为空时保持原始顺序
+            merge_duplicates: 饼图是否合并同名扇区
+            other_label: 合并剩余扇区使用的名称
+            reduction: 散点图数据缩减方式 (bin, sample)，为空时保留全部点
+            bin_shape: 分箱网格形状 (square, hex)
+            bin_output: 分箱结果的展示方式 (bubble, heatmap)
+            grid_size: 每个坐标轴上的格子数，默认使用 settings.SCATTER_GRID_SIZE
+            sample_size: 分层采样保留的点数，默认使用 settings.SCATTER_SAMPLE_SIZE
             
         Returns:
             格式化后的数据
         """
         if chart_type == "pie":
             # 转换为饼图数据格式
-            return cls._format_for_pie(data)
+            return cls._format_for_pie(data, top_n, sort, merge_duplicates, other_label)
+        elif chart_type == "scatter" and reduction is not None:
+            return cls._reduce_scatter(data, reduction, bin_shape, bin_output, grid_size, sample_size)
         else:
             # 其他图表类型
             return data
     
     @classmethod
-    def _format_for_pie(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+    def _format_for_pie(cls, data: Dict[str, Any], top_n: Optional[int] = None,
+                        sort: Optional[str] = None, merge_duplicates: bool = False,
+                        other_label: str = "其他") -> Dict[str, Any]:
         """
         格式化为饼图数据格式
         
         Args:
             data: 原始数据
+            top_n: 保留的最大扇区数，默认使用 settings.PIE_MAX_SLICES（为空时不合并）
+            sort: 扇区排序 (desc, asc)
+            merge_duplicates: 是否合并同名扇区
+            other_label: 合并剩余扇区使用的名称
             
         Returns:
             饼图数据格式
@@ -284,4 +566,365 @@ class DataProcessor:
                     if isinstance(item, dict) and "name" in item and "value" in item:
                         pie_data.append(item)
         
+        if merge_duplicates and pie_data:
+            pie_data = cls._merge_pie_items(pie_data)
+        
+        other = None
+        top_n = top_n or settings.PIE_MAX_SLICES
+        if top_n and len(pie_data) > top_n:
+            pie_data, other = cls._top_pie_items(pie_data, top_n, other_label)
+        
+        if sort in ("desc", "asc"):
+            pie_data.sort(key=cls._pie_value, reverse=(sort == "desc"))
+        elif sort is not None:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        
+        # 合并出的剩余扇区始终放在最后
+        if other is not None:
+            pie_data.append(other)
         return {"data": pie_data}
+    
+    @staticmethod
+    def _pie_value(item: Dict[str, Any]) -> float:
+        """扇区的数值，非数值按 0 处理"""
+        value = item.get("value")
+        return value if isinstance(value, (int, float)) and value == value else 0
+    
+    @classmethod
+    def _merge_pie_items(cls, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        按名称分组合并扇区，数值求和，其他字段取第一次出现的扇区
+        
+        Args:
+            items: 饼图扇区列表
+            
+        Returns:
+            合并后的扇区列表，按名称第一次出现的顺序排列
+        """
+        import pandas as pd
+        
+        frame = pd.DataFrame({
+            "name": [str(item["name"]) for item in items],
+            "value": pd.to_numeric(pd.Series([item["value"] for item in items], dtype=object), errors="coerce")
+        })
+        grouped = frame.reset_index().groupby("name", sort=False).agg(
+            first=("index", "first"), value=("value", "sum")
+        )
+        if len(grouped) == len(items):
+            return items
+        
+        merged = []
+        for first, value in zip(grouped["first"].tolist(), grouped["value"].tolist()):
+            item = dict(items[first])
+            item["value"] = int(value) if float(value).is_integer() else value
+            merged.append(item)
+        return merged
+    
+    @classmethod
+    def _top_pie_items(cls, items: List[Dict[str, Any]], top_n: int,
+                       other_label: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        保留数值最大的 top_n - 1 个扇区（保持原始顺序），其余合并为一个扇区
+        
+        使用大小为 k 的堆选取，复杂度 O(n log k)。
+        
+        Args:
+            items: 饼图扇区列表
+            top_n: 输出的扇区总数（包含合并出的扇区）
+            other_label: 合并出的扇区名称
+            
+        Returns:
+            (保留的扇区列表, 合并出的扇区)
+        """
+        values = [cls._pie_value(item) for item in items]
+        top_indices = sorted(heapq.nlargest(top_n - 1, range(len(items)), key=values.__getitem__))
+        
+        kept = [items[i] for i in top_indices]
+        other_value = sum(values) - sum(values[i] for i in top_indices)
+        if isinstance(other_value, float):
+            other_value = round(other_value, 10)
+        return kept, {"name": other_label, "value": other_value}
+    
+    @classmethod
+    def _scatter_points(cls, data: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        """
+        提取每个散点系列的 [x, y] 坐标
+        
+        series.data 为 [x, y] 点时直接使用，为标量时与 xAxis 配对（CSV 数据的格式），
+        非数值的点被丢弃。
+        
+        Args:
+            data: 原始数据
+            
+        Returns:
+            [(系列名称, (n, 2) 坐标数组)]
+        """
+        import numpy as np
+        
+        series_list = data.get("series")
+        if isinstance(series_list, dict):
+            series_list = [series_list]
+        if not isinstance(series_list, list):
+            raise ValueError("散点图数据缺少 series")
+        
+        x_axis = data.get("xAxis")
+        if isinstance(x_axis, dict):
+            x_axis = x_axis.get("data")
+        
+        def number(v: Any) -> Optional[float]:
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                return v
+            if isinstance(v, str):
+                try:
+                    return float(v)
+                except ValueError:
+                    return None
+            return None
+        
+        result = []
+        for i, series in enumerate(series_list):
+            values = series.get("data") if isinstance(series, dict) else None
+            if not isinstance(values, list):
+                continue
+            name = str(series.get("name") or f"series{i + 1}")
+            
+            # 全部为数值点时整体转换，否则逐点检查
+            try:
+                array = np.asarray(values, dtype=float)
+                if array.ndim == 2 and array.shape[1] >= 2:
+                    array = array[:, :2]
+                elif array.ndim == 1 and isinstance(x_axis, list) and len(x_axis) >= len(array):
+                    array = np.column_stack([np.asarray(x_axis[:len(array)], dtype=float), array])
+                else:
+                    array = None
+            except (TypeError, ValueError):
+                array = None
+            if array is not None:
+                result.append((name, array[np.isfinite(array).all(axis=1)]))
+                continue
+            
+            points = []
+            for j, item in enumerate(values):
+                if isinstance(item, dict):
+                    item = item.get("value")
+                if isinstance(item, (list, tuple)) and len(item) >= 2:
+                    x, y = number(item[0]), number(item[1])
+                elif isinstance(x_axis, list) and j < len(x_axis):
+                    x, y = number(x_axis[j]), number(item)
+                else:
+                    continue
+                if x is not None and y is not None and x == x and y == y:
+                    points.append([x, y])
+            result.append((name, np.asarray(points, dtype=float).reshape(-1, 2)))
+        return result
+    
+    @classmethod
+    def _reduce_scatter(cls, data: Dict[str, Any], reduction: str, bin_shape: str = "square",
+                        bin_output: str = "bubble", grid_size: Optional[int] = None,
+                        sample_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        缩减大型散点图的数据量，输出大小由网格分辨率决定而不是输入点数
+        
+        bin: 把点按正方形或六边形网格分箱，每个非空格子输出一个 [x, y, count] 点，
+        通过 visualMap 按数量映射气泡大小（bubble）或颜色（heatmap）；
+        sample: 按正方形网格分层采样，每个格子按点数比例保留，稀疏格子至少保留一个点，离群点全部保留。
+        所有系列共用同一个网格范围。
+        
+        Args:
+            data: 原始数据
+            reduction: 缩减方式 (bin, sample)
+            bin_shape: 分箱网格形状 (square, hex)
+            bin_output: 分箱结果的展示方式 (bubble, heatmap)
+            grid_size: 每个坐标轴上的格子数
+            sample_size: 分层采样保留的点数
+            
+        Returns:
+            散点图数据，包含 series 以及分箱时的 visualMap
+        """
+        import numpy as np
+        
+        if reduction not in ("bin", "sample"):
+            raise ValueError(f"不支持的散点图缩减方式: {reduction}")
+        if bin_shape not in ("square", "hex"):
+            raise ValueError(f"不支持的分箱形状: {bin_shape}")
+        if bin_output not in ("bubble", "heatmap"):
+            raise ValueError(f"不支持的分箱展示方式: {bin_output}")
+        grid_size = grid_size or settings.SCATTER_GRID_SIZE
+        
+        named_points = cls._scatter_points(data)
+        non_empty = [points for _, points in named_points if len(points)]
+        if not non_empty:
+            return {"series": [{"name": name, "data": []} for name, _ in named_points]}
+        
+        # 所有系列共用同一个网格
+        all_points = np.concatenate(non_empty)
+        lower = all_points.min(axis=0)
+        span = all_points.max(axis=0) - lower
+        span[span == 0] = 1.0
+        
+        if reduction == "sample":
+            sample_size = sample_size or settings.SCATTER_SAMPLE_SIZE
+            series = []
+            total = kept = outliers = 0
+            for name, points in named_points:
+                keep, outlier_count = cls._stratified_sample(points, lower, span, grid_size, sample_size)
+                series.append({"name": name, "data": points[keep].tolist()})
+                total += len(points)
+                kept += len(keep)
+                outliers += outlier_count
+            return {"series": series, "sampling": {"total": total, "kept": kept, "outliers": outliers}}
+        
+        series = []
+        max_count = 1
+        for name, points in named_points:
+            if bin_shape == "hex":
+                centers, counts = cls._hex_bins(points, lower, span, grid_size)
+            else:
+                centers, counts = cls._square_bins(points, lower, span, grid_size)
+            if len(counts):
+                max_count = max(max_count, int(counts.max()))
+            binned = np.column_stack([centers, counts]).tolist()
+            for point in binned:
+                point[2] = int(point[2])
+            item = {"name": name, "data": binned}
+            if bin_output == "heatmap":
+                # 格子按约 600px 的绘图区估算像素大小
+                item["symbol"] = "rect" if bin_shape == "square" else _HEXAGON_SYMBOL
+                item["symbolSize"] = max(2, round(600 / grid_size))
+            series.append(item)
+        
+        visual_map = {
+            "type": "continuous",
+            "dimension": 2,
+            "min": 1,
+            "max": max_count,
+            "calculable": True
+        }
+        if bin_output == "heatmap":
+            visual_map["inRange"] = {"color": ["#e0f3f8", "#fee090", "#f46d43", "#a50026"]}
+        else:
+            visual_map["inRange"] = {"symbolSize": [4, 30]}
+            visual_map["show"] = False
+        return {
+            "series": series,
+            "visualMap": visual_map,
+            "binning": {"shape": bin_shape, "grid_size": grid_size, "total": int(len(all_points))}
+        }
+    
+    @classmethod
+    def _square_bins(cls, points: Any, lower: Any, span: Any, grid_size: int) -> Tuple[Any, Any]:
+        """
+        正方形网格分箱
+        
+        Args:
+            points: (n, 2) 坐标数组
+            lower: 网格左下角
+            span: 网格在两个坐标轴上的跨度
+            grid_size: 每个坐标轴上的格子数
+            
+        Returns:
+            (非空格子中心坐标, 每个格子的点数)
+        """
+        import numpy as np
+        
+        cells = np.clip(((points - lower) / span * grid_size).astype(np.int64), 0, grid_size - 1)
+        counts = np.bincount(cells[:, 0] * grid_size + cells[:, 1], minlength=grid_size * grid_size)
+        occupied = np.flatnonzero(counts)
+        centers = np.column_stack([occupied // grid_size, occupied % grid_size]) + 0.5
+        return lower + centers / grid_size * span, counts[occupied]
+    
+    @classmethod
+    def _hex_bins(cls, points: Any, lower: Any, span: Any, grid_size: int) -> Tuple[Any, Any]:
+        """
+        六边形网格分箱：每个点归入两个错开的矩形格点中较近的一个中心
+        
+        Args:
+            points: (n, 2) 坐标数组
+            lower: 网格左下角
+            span: 网格在两个坐标轴上的跨度
+            grid_size: x 轴上的格子数，y 轴格子数按六边形比例缩小
+            
+        Returns:
+            (非空格子中心坐标, 每个格子的点数)
+        """
+        import numpy as np
+        
+        nx = grid_size
+        ny = max(1, int(round(grid_size / math.sqrt(3))))
+        x = (points[:, 0] - lower[0]) / span[0] * nx
+        y = (points[:, 1] - lower[1]) / span[1] * ny
+        
+        # 第一组中心位于整数格点，第二组错开半格
+        ix1, iy1 = np.round(x).astype(np.int64), np.round(y).astype(np.int64)
+        ix2, iy2 = np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+        d1 = (x - ix1) ** 2 + 3.0 * (y - iy1) ** 2
+        d2 = (x - ix2 - 0.5) ** 2 + 3.0 * (y - iy2 - 0.5) ** 2
+        first = d1 < d2
+        
+        size1 = (nx + 1) * (ny + 1)
+        keys = np.where(first, ix1 * (ny + 1) + iy1, size1 + np.minimum(ix2, nx - 1) * ny + np.minimum(iy2, ny - 1))
+        counts = np.bincount(keys, minlength=size1 + nx * ny)
+        occupied = np.flatnonzero(counts)
+        
+        in_first = occupied < size1
+        second = occupied - size1
+        cx = np.where(in_first, occupied // (ny + 1), second // ny + 0.5)
+        cy = np.where(in_first, occupied % (ny + 1), second % ny + 0.5)
+        centers = np.column_stack([lower[0] + cx / nx * span[0], lower[1] + cy / ny * span[1]])
+        return centers, counts[occupied]
+    
+    @classmethod
+    def _stratified_sample(cls, points: Any, lower: Any, span: Any, grid_size: int,
+                           sample_size: int) -> Tuple[Any, int]:
+        """
+        按正方形网格分层采样，离群点全部保留
+        
+        离群点按中位数绝对偏差计算的稳健 z 分数判断，超过 SCATTER_OUTLIER_Z 的点不参与采样直接保留。
+        其余点按所在格子的点数比例分配名额，每个非空格子至少一个，格内随机选取（固定随机种子，结果可复现）。
+        
+        Args:
+            points: (n, 2) 坐标数组
+            lower: 网格左下角
+            span: 网格在两个坐标轴上的跨度
+            grid_size: 每个坐标轴上的格子数
+            sample_size: 目标保留点数
+            
+        Returns:
+            (保留的点在原数组中的下标，按原顺序排列, 离群点数)
+        """
+        import numpy as np
+        
+        n = len(points)
+        if n <= sample_size:
+            return np.arange(n), 0
+        
+        median = np.median(points, axis=0)
+        mad = np.median(np.abs(points - median), axis=0) * 1.4826
+        mad[mad == 0] = np.inf
+        z = np.abs(points - median) / mad
+        outlier = (z > settings.SCATTER_OUTLIER_Z).any(axis=1)
+        outlier_indices = np.flatnonzero(outlier)
+        if len(outlier_indices) >= sample_size:
+            # 离群点过多时保留最极端的部分
+            strongest = np.argsort(-z[outlier_indices].max(axis=1))[:sample_size]
+            return np.sort(outlier_indices[strongest]), sample_size
+        
+        regular = np.flatnonzero(~outlier)
+        cells = np.clip(((points[regular] - lower) / span * grid_size).astype(np.int64), 0, grid_size - 1)
+        keys = cells[:, 0] * grid_size + cells[:, 1]
+        
+        # 随机打乱后按格子稳定排序，得到每个点在格内的随机名次
+        rng = np.random.default_rng(0)
+        order = rng.permutation(len(regular))
+        order = order[np.argsort(keys[order], kind="stable")]
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        group_sizes = np.diff(np.r_[starts, len(order)])
+        rank = np.arange(len(order)) - np.repeat(starts, group_sizes)
+        
+        budget = sample_size - len(outlier_indices)
+        quotas = np.maximum(1, np.floor(group_sizes * budget / len(regular))).astype(np.int64)
+        selected = order[rank < np.repeat(quotas, group_sizes)]
+        keep = np.sort(np.concatenate([regular[selected], outlier_indices]))
+        return keep, len(outlier_indices)
+
@@ -0,0 +1,368 @@
+import multiprocessing
+import signal
+import threading
+import time
+from contextvars import ContextVar
+from multiprocessing import shared_memory
+from typing import Dict, Any, Optional, List, NamedTuple, Tuple
+
+from config import settings
+from data_processor import DataProcessor
+
+
+# 当前请求的取消信号，由 /call 入口在客户端断开时置位，进程池等待结果时检查
+current_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("data_job_cancel", default=None)
+
+# 等待工作进程结果时检查取消和超时的间隔（秒）
+_POLL_INTERVAL = 0.1
+
+
+class JobCancelled(Exception):
+    """客户端已断开，数据处理任务被取消"""
+
+
+class _SharedArray(NamedTuple):
+    """通过共享内存传回的数值数组"""
+    name: str
+    dtype: str
+    shape: Tuple[int, ...]
+
+
+def _numeric_array(values: List[Any]):
+    """把整数或浮点数组成的一维/二维列表转换为 numpy 数组，其他列表返回 None"""
+    import numpy as np
+
+    first = values[0]
+    if isinstance(first, bool) or not isinstance(first, (int, float, list)):
+        return None
+    try:
+        array = np.asarray(values)
+    except (ValueError, OverflowError):
+        return None
+    if array.dtype.kind not in "if" or array.ndim > 2:
+        return None
+    return array
+
+
+def _pack(value: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+    """把结果中较长的数值数组写入共享内存，替换为 _SharedArray 描述"""
+    if isinstance(value, dict):
+        return {key: _pack(item, blocks) for key, item in value.items()}
+    if isinstance(value, list):
+        if len(value) >= settings.DATA_WORKER_SHM_MIN_ITEMS:
+            array = _numeric_array(value)
+            if array is not None:
+                import numpy as np
+
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+                return _SharedArray(block.name, array.dtype.str, array.shape)
+        return [_pack(item, blocks) for item in value]
+    return value
+
+
+def _unpack(value: Any, blocks: Dict[str, shared_memory.SharedMemory]) -> Any:
+    """把 _SharedArray 描述还原为列表"""
+    if isinstance(value, _SharedArray):
+        import numpy as np
+
+        return np.ndarray(value.shape, np.dtype(value.dtype), buffer=blocks[value.name].buf).tolist()
+    if isinstance(value, dict):
+        return {key: _unpack(item, blocks) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_unpack(item, blocks) for item in value]
+    return value
+
+
+def _process(data: Any, data_type: Optional[str], chart_type: Optional[str],
+             options: Dict[str, Any]) -> Dict[str, Any]:
+    """解析数据并按图表类型格式化，同时计算数据概况"""
+    processed = DataProcessor.process_data(data, data_type)
+    if chart_type:
+        processed = DataProcessor.format_for_echarts(processed, chart_type, **options)
+    return {"data": processed, "profile": DataProcessor.profile_data(processed)}
+
+
+def _worker_main(conn) -> None:
+    """工作进程主循环：逐个接收任务，数值数组放入共享内存，其余结果经管道返回"""
+    # 中断信号由主进程处理，工作进程随主进程退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 启动时导入 pandas，使进程池保持“热”状态
+    import pandas  # noqa: F401
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        blocks: List[shared_memory.SharedMemory] = []
+        try:
+            packed = _pack(_process(*job), blocks)
+            conn.send(("ok", packed, [block.name for block in blocks]))
+        except Exception as e:
+            # 发送失败时主进程拿不到共享内存的名字，由本进程释放
+            for block in blocks:
+                block.unlink()
+            blocks = []
+            conn.send(("error", str(e), []))
+        finally:
+            for block in blocks:
+                block.close()
+
+
+class _Worker:
+    """一个常驻工作进程及其管道"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), name="data-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self) -> None:
+        """终止进程"""
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class DataWorkerPool:
+    """
+    重量级数据处理的常驻进程池
+
+    CSV/JSON 大字符串和 Excel 的 pandas 解析及格式化在工作进程中执行，不占用事件循环和线程池；
+    结果中的数值数组通过共享内存传回，避免逐个元素序列化。每个任务有超时，
+    超时或客户端断开时终止对应的工作进程并补充新进程。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, timeout: Optional[float] = None):
+        """
+        初始化进程池，工作进程在首次使用或调用 start() 时创建
+
+        Args:
+            max_workers: 工作进程数，默认使用 settings.DATA_WORKER_MAX_WORKERS
+            timeout: 单个任务的超时秒数（含排队），默认使用 settings.DATA_JOB_TIMEOUT
+        """
+        # 默认值在使用时才读取，模块级实例不会在导入时创建 Settings
+        self._max_workers = max_workers
+        self._timeout = timeout
+        # spawn 避免在多线程的服务进程中 fork
+        self._context = multiprocessing.get_context("spawn")
+        self._condition = threading.Condition()
+        self._idle: List[_Worker] = []
+        self._workers = 0
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+    @property
+    def max_workers(self) -> int:
+        """工作进程数上限"""
+        return self._max_workers or settings.DATA_WORKER_MAX_WORKERS
+
+    @property
+    def timeout(self) -> float:
+        """单个任务的超时秒数"""
+        return self._timeout or settings.DATA_JOB_TIMEOUT
+
+    def should_offload(self, data: Any, data_type: Optional[str] = None) -> bool:
+        """
+        判断数据是否值得交给工作进程处理
+
+        Args:
+            data: 原始数据
+            data_type: 数据类型
+
+        Returns:
+            Excel 数据或长度达到 DATA_WORKER_MIN_BYTES 的字符串返回 True
+        """
+        if not settings.DATA_WORKER_ENABLED or self._closed:
+            return False
+        if data_type == "excel":
+            return True
+        return isinstance(data, str) and len(data) >= settings.DATA_WORKER_MIN_BYTES
+
+    def process(self, data: Any, data_type: Optional[str] = None, chart_type: Optional[str] = None,
+                **options: Any) -> Dict[str, Any]:
+        """
+        处理数据，较大的数据在工作进程中执行，其余在当前线程执行
+
+        Args:
+            data: 原始数据
+            data_type: 数据类型 (json, csv, excel, dict)
+            chart_type: 目标图表类型，为空时只解析不格式化
+            **options: 传给 DataProcessor.format_for_echarts 的参数
+
+        Returns:
+            处理后的数据
+
+        Raises:
+            TimeoutError: 任务超时
+            JobCancelled: 客户端已断开
+        """
+        if not self.should_offload(data, data_type):
+            return _process(data, data_type, chart_type, options)
+        return self.run(data, data_type, chart_type, options)
+
+    def run(self, data: Any, data_type: Optional[str], chart_type: Optional[str],
+            options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        在工作进程中处理数据
+
+        Args:
+            data: 原始数据
+            data_type: 数据类型
+            chart_type: 目标图表类型
+            options: 传给 DataProcessor.format_for_echarts 的参数
+
+        Returns:
+            {"data": 处理后的数据, "profile": 数据概况}
+
+        Raises:
+            ValueError: 数据处理失败
+            TimeoutError: 任务超时
+            JobCancelled: 客户端已断开
+            RuntimeError: 工作进程异常退出
+        """
+        deadline = time.monotonic() + self.timeout
+        cancel = current_cancel_event.get()
+        worker = self._acquire(deadline, cancel)
+        try:
+            worker.conn.send((data, data_type, chart_type, options))
+            while not worker.conn.poll(_POLL_INTERVAL):
+                self._check(deadline, cancel)
+            status, payload, names = worker.conn.recv()
+        except (TimeoutError, JobCancelled):
+            # 超时或取消：终止正在执行的进程，结果已无人需要
+            self._discard(worker)
+            raise
+        except (EOFError, OSError):
+            self._discard(worker)
+            with self._condition:
+                self.failed += 1
+            raise RuntimeError("数据处理进程异常退出")
+        except BaseException:
+            self._discard(worker)
+            raise
+        self._release(worker)
+
+        blocks = {}
+        try:
+            for name in names:
+                blocks[name] = shared_memory.SharedMemory(name=name)
+            if status == "error":
+                with self._condition:
+                    self.failed += 1
+                raise ValueError(payload)
+            result = _unpack(payload, blocks)
+        finally:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+        with self._condition:
+            self.completed += 1
+        return result
+
+    def start(self) -> None:
+        """预先创建全部工作进程"""
+        with self._condition:
+            if self._closed:
+                return
+            count = self.max_workers - self._workers
+            self._workers += count
+        workers = [_Worker(self._context) for _ in range(count)]
+        with self._condition:
+            self._idle.extend(workers)
+            self._condition.notify_all()
+
+    def shutdown(self) -> None:
+        """终止空闲的工作进程，正在执行的进程在任务结束后终止"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._workers -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回进程数和任务统计"""
+        with self._condition:
+            return {
+                "workers": self._workers,
+                "idle": len(self._idle),
+                "max_workers": self.max_workers,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "cancelled": self.cancelled
+            }
+
+    def _check(self, deadline: float, cancel: Optional[threading.Event]) -> None:
+        """超时或已取消时抛出异常"""
+        if cancel is not None and cancel.is_set():
+            with self._condition:
+                self.cancelled += 1
+            raise JobCancelled("客户端已断开，数据处理已取消")
+        if time.monotonic() >= deadline:
+            with self._condition:
+                self.timed_out += 1
+            raise TimeoutError(f"数据处理超过 {self.timeout} 秒，已终止")
+
+    def _acquire(self, deadline: float, cancel: Optional[threading.Event]) -> _Worker:
+        """取得一个空闲进程，未达到进程数上限时新建"""
+        with self._condition:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.process.is_alive():
+                        return worker
+                    # 空闲期间意外退出的进程直接丢弃
+                    self._workers -= 1
+                    worker.conn.close()
+                if self._workers < self.max_workers:
+                    self._workers += 1
+                    break
+                self._check(deadline, cancel)
+                self._condition.wait(min(_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+        try:
+            return _Worker(self._context)
+        except BaseException:
+            with self._condition:
+                self._workers -= 1
+                self._condition.notify_all()
+            raise
+
+    def _release(self, worker: _Worker) -> None:
+        """任务完成后放回空闲队列"""
+        with self._condition:
+            if not self._closed:
+                self._idle.append(worker)
+                self._condition.notify_all()
+                return
+            self._workers -= 1
+        worker.stop()
+
+    def _discard(self, worker: _Worker) -> None:
+        """终止进程，并补充一个新进程以保持进程池的热状态"""
+        worker.stop()
+        with self._condition:
+            if self._closed:
+                self._workers -= 1
+                return
+        replacement = None
+        try:
+            replacement = _Worker(self._context)
+        finally:
+            with self._condition:
+                if replacement is None:
+                    self._workers -= 1
+                else:
+                    self._idle.append(replacement)
+                self._condition.notify_all()
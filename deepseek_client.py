@@ -1,7 +1,15 @@
-import requests
+import copy
 import json
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple, TYPE_CHECKING
 from config import settings
+from prompt_cache import PromptCache
+from json_repair import JSONExtractError, extract_json_object, unwrap_code_fence
+from echarts_utils import EChartsUtils
+from model_router import ModelRouter
+from llm_scheduler import LLMScheduler, SchedulerOverloaded
+
+if TYPE_CHECKING:
+    import requests
 
 
 class DeepSeekClient:
@@ -12,11 +20,19 @@ class DeepSeekClient:
         self.api_key = settings.DEEPSEEK_API_KEY
         self.api_url = settings.DEEPSEEK_API_URL
         self.model = settings.DEEPSEEK_MODEL
+        self.prompt_cache = PromptCache(
+            threshold=settings.PROMPT_CACHE_THRESHOLD,
+            max_entries=settings.PROMPT_CACHE_SIZE
+        ) if settings.PROMPT_CACHE_ENABLED else None
+        self.model_router = ModelRouter()
+        self.scheduler = LLMScheduler()
         
     def generate_response(self, messages: List[Dict[str, str]], 
                          temperature: float = 0.7, 
                          max_tokens: int = 1024, 
-                         stream: bool = False) -> Dict[str, Any]:
+                         stream: bool = False,
+                         model: Optional[str] = None,
+                         timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         生成模型响应
         
@@ -25,48 +41,70 @@ class DeepSeekClient:
             temperature: 温度参数，控制输出随机性
             max_tokens: 最大令牌数
             stream: 是否流式响应
+            model: 使用的模型，默认为 settings.DEEPSEEK_MODEL
+            timeout: 请求超时（秒），默认为 settings.DEEPSEEK_TIMEOUT
             
         Returns:
             模型响应结果
+            
+        Raises:
+            SchedulerOverloaded: 排队期限内无法获得上游调用名额
         """
         if not self.api_key:
             raise ValueError("DeepSeek API Key 未配置")
         
+        # 延迟导入 requests，避免拖慢服务器启动
+        import requests
+        
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
         
         payload = {
-            "model": self.model,
+            "model": model or self.model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
             "stream": stream
         }
         
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                stream=stream,
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            
-            if stream:
-                # 处理流式响应
-                return self._handle_stream_response(response)
-            else:
-                # 处理普通响应
-                return response.json()
+        # 预扣输入和最大输出的 token，调用结束后按实际用量修正
+        prompt_chars = sum(len(message["content"]) for message in messages)
+        estimated_tokens = prompt_chars / settings.TOKEN_ESTIMATE_CHARS_PER_TOKEN + max_tokens
+        
+        with self.scheduler.admit(estimated_tokens) as ticket:
+            try:
+                response = requests.post(
+                    self.api_url,
+                    headers=headers,
+                    json=payload,
+                    stream=stream,
+                    timeout=timeout or settings.DEEPSEEK_TIMEOUT
+                )
+                
+                if response.status_code == 429:
+                    # 上游限流，暂停放行后续请求，并让调用方稍后重试
+                    retry_after = response.headers.get("Retry-After", "")
+                    delay = float(retry_after) if retry_after.isdigit() else 5.0
+                    self.scheduler.backoff(delay)
+                    raise SchedulerOverloaded("DeepSeek API 限流，请稍后重试", delay)
+                response.raise_for_status()
                 
-        except requests.RequestException as e:
-            raise Exception(f"DeepSeek API 调用失败: {str(e)}")
+                if stream:
+                    # 处理流式响应
+                    result = self._handle_stream_response(response)
+                else:
+                    # 处理普通响应
+                    result = response.json()
+                    
+            except requests.RequestException as e:
+                raise Exception(f"DeepSeek API 调用失败: {str(e)}")
+            
+            ticket.settle((result.get("usage") or {}).get("total_tokens"))
+            return result
     
-    def _handle_stream_response(self, response: requests.Response) -> Dict[str, Any]:
+    def _handle_stream_response(self, response: "requests.Response") -> Dict[str, Any]:
         """
         处理流式响应
         
@@ -123,6 +161,28 @@ class DeepSeekClient:
         Returns:
             ECharts 配置对象
         """
+        return self.generate_echarts_config_with_usage(user_prompt, data)["config"]
+    
+    def generate_echarts_config_with_usage(self, user_prompt: str,
+                                           data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        生成 ECharts 配置，同时返回所用模型、max_tokens 和 token 用量
+        
+        Args:
+            user_prompt: 用户提示
+            data: 可选的数据集
+            
+        Returns:
+            包含 config、model、max_tokens、usage 的字典，命中缓存时 model 为 None
+        """
+        # 相似提示且数据结构相同时，直接复用缓存的配置骨架
+        if self.prompt_cache is not None:
+            cached = self.prompt_cache.get(user_prompt, data)
+            if cached is not None:
+                return {"config": cached, "model": None, "max_tokens": None, "usage": None}
+        
+        prompt_data = self._format_prompt_data(data)
+        plan = self.model_router.plan(user_prompt, data, prompt_data if data else "")
         messages = [
             {
                 "role": "system",
@@ -130,24 +190,142 @@ class DeepSeekClient:
             },
             {
                 "role": "user",
-                "content": f"用户需求: {user_prompt}\n\n数据: {json.dumps(data, ensure_ascii=False) if data else '无'}\n\n请生成 ECharts 配置对象:"
+                "content": f"用户需求: {user_prompt}\n\n数据: {prompt_data}\n\n请生成 ECharts 配置对象:"
             }
         ]
         
-        response = self.generate_response(messages, temperature=0.3, max_tokens=2048)
+        response = self.generate_response(
+            messages,
+            temperature=plan["temperature"],
+            max_tokens=plan["max_tokens"],
+            model=plan["model"],
+            timeout=plan["timeout"]
+        )
+        usage = dict(response.get("usage") or {})
+        self.model_router.observe(plan, usage, response['choices'][0].get("finish_reason"))
         
         # 提取配置内容
         content = response['choices'][0]['message']['content']
+        config, _ = self._parse_config(content, usage)
+        if self.prompt_cache is not None:
+            self.prompt_cache.put(user_prompt, data, config)
+        return {"config": config, "model": plan["model"], "max_tokens": plan["max_tokens"], "usage": usage}
+    
+    def refine_echarts_config(self, skeleton: Dict[str, Any], instruction: str) -> Dict[str, Any]:
+        """
+        按指令修改配置，只发送不含数据的配置骨架，模型返回 JSON Merge Patch
         
-        # 尝试解析 JSON
-        try:
-            # 清理内容，移除可能的代码块标记
-            if content.startswith('```json'):
-                content = content[7:]
-            if content.endswith('```'):
-                content = content[:-3]
+        Args:
+            skeleton: 数据数组已替换为占位符的配置骨架
+            instruction: 修改指令
+            
+        Returns:
+            包含 patch、model、max_tokens、usage 的字典
             
-            config = json.loads(content)
-            return config
-        except json.JSONDecodeError as e:
-            raise Exception(f"ECharts 配置生成失败: {str(e)}")
+        Raises:
+            Exception: 补丁被 max_tokens 截断或无法解析
+        """
+        plan = {
+            "model": settings.DEEPSEEK_MODEL,
+            "max_tokens": settings.REFINE_MAX_TOKENS,
+            "temperature": 0.2,
+            "timeout": settings.DEEPSEEK_TIMEOUT
+        }
+        messages = [
+            {
+                "role": "system",
+                "content": "你是一个 ECharts 配置编辑助手。用户会提供当前配置（数据数组已替换为 \"@data:...\" 占位符）和修改要求。"
+                           "请只返回一个 JSON Merge Patch (RFC 7396)：只包含需要修改的字段，需要删除的字段设为 null，数组会被整体替换。"
+                           "替换包含占位符的数组（如 series）时原样保留占位符字符串，不要编造数据。不要包含其他解释性文本。"
+            },
+            {
+                "role": "user",
+                "content": f"当前配置: {json.dumps(skeleton, ensure_ascii=False, separators=(',', ':'))}\n\n修改要求: {instruction}\n\nJSON Merge Patch:"
+            }
+        ]
+        
+        response = self.generate_response(
+            messages,
+            temperature=plan["temperature"],
+            max_tokens=plan["max_tokens"],
+            model=plan["model"],
+            timeout=plan["timeout"]
+        )
+        usage = dict(response.get("usage") or {})
+        # 被截断的补丁可能缺少字段（如 series 的 data），合并后会悄悄丢失数据，因此直接拒绝
+        if response['choices'][0].get("finish_reason") == "length":
+            raise Exception(f"修改补丁超过 max_tokens ({plan['max_tokens']}) 被截断，未保存新版本")
+        content = response['choices'][0]['message']['content']
+        patch, truncated = self._parse_config(content, usage, require_echarts_keys=False)
+        if truncated:
+            raise Exception("修改补丁不完整（输出被截断），未保存新版本")
+        return {"patch": patch, "model": plan["model"], "max_tokens": plan["max_tokens"], "usage": usage}
+    
+    def _format_prompt_data(self, data: Optional[Dict[str, Any]]) -> str:
+        """
+        将数据序列化为提示中使用的紧凑 JSON
+        
+        Args:
+            data: 数据集
+            
+        Returns:
+            JSON 字符串，没有数据时返回 "无"
+        """
+        if not data:
+            return "无"
+        if settings.PROMPT_SIGNIFICANT_DIGITS is not None:
+            data = EChartsUtils.quantize_config(copy.deepcopy(data), settings.PROMPT_SIGNIFICANT_DIGITS)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    
+    def _parse_config(self, content: str, usage: Dict[str, Any],
+                      require_echarts_keys: bool = True) -> Tuple[Dict[str, Any], bool]:
+        """
+        解析模型输出的配置，无法修复时只把解析错误和出错位置附近的片段发回模型修正
+        
+        Args:
+            content: 模型输出
+            usage: token 用量，修正请求的用量会累加到其中
+            require_echarts_keys: 是否要求对象包含 ECharts 顶层字段，解析 Merge Patch 时为 False
+            
+        Returns:
+            (ECharts 配置对象, 输出是否被截断)
+        """
+        for attempt in range(settings.JSON_REPAIR_MAX_RETRIES + 1):
+            try:
+                return extract_json_object(content, require_echarts_keys)
+            except JSONExtractError as e:
+                error = e
+            
+            # 没有出错位置（如找不到对象）时，片段修正无济于事
+            if attempt == settings.JSON_REPAIR_MAX_RETRIES or error.pos is None:
+                break
+            
+            # 只发送解析错误和出错位置附近的片段，修正后的片段在本地替换回原输出
+            start = max(0, error.pos - settings.JSON_REPAIR_CONTEXT_CHARS)
+            end = min(len(content), error.pos + settings.JSON_REPAIR_CONTEXT_CHARS)
+            messages = [
+                {
+                    "role": "system",
+                    "content": "你是一个 JSON 修复工具。用户会提供解析错误和 ECharts 配置中出错位置附近的一段文本，"
+                               "请修正这段文本中的语法错误，只返回修正后的这段文本：不要补全片段前后缺失的内容，不要包含其他解释性文本。"
+                },
+                {
+                    "role": "user",
+                    "content": f"解析错误: {error.message}（位于片段第 {error.pos - start} 个字符）\n\n"
+                               f"出错位置附近的文本:\n{content[start:end]}"
+                }
+            ]
+            response = self.generate_response(
+                messages,
+                temperature=0,
+                max_tokens=settings.JSON_REPAIR_MAX_TOKENS,
+                model=settings.DEEPSEEK_MODEL,
+                timeout=settings.DEEPSEEK_TIMEOUT
+            )
+            for key, value in (response.get("usage") or {}).items():
+                if isinstance(value, (int, float)):
+                    usage[key] = usage.get(key, 0) + value
+            fixed = unwrap_code_fence(response['choices'][0]['message']['content'])
+            content = content[:start] + fixed + content[end:]
+        
+        raise Exception(f"ECharts 配置生成失败: {error}")
@@ -1,6 +1,10 @@
+import copy
 import json
+import math
+from html import escape
 from typing import Dict, Any, Optional, List
 from config import settings
+from data_processor import DataProcessor
 
 
 class EChartsUtils:
@@ -68,7 +72,9 @@ class EChartsUtils:
     
     @classmethod
     def create_chart_config(cls, chart_type: str, data: Optional[Dict[str, Any]] = None, 
-                          title: str = "", theme: str = "light") -> Dict[str, Any]:
+                          title: str = "", theme: str = "light", data_format: Optional[str] = None,
+                          significant_digits: Optional[int] = None,
+                          precision: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
         """
         创建图表配置
         
@@ -77,6 +83,9 @@ class EChartsUtils:
             data: 数据集
             title: 图表标题
             theme: 主题 (light, dark)
+            data_format: 数据输出格式 (series, dataset)，默认使用 settings.CHART_DATA_FORMAT
+            significant_digits: 数值保留的有效数字位数，默认使用 settings.CHART_SIGNIFICANT_DIGITS
+            precision: 按 series 名称指定的小数位数，优先于 significant_digits
             
         Returns:
             ECharts 配置对象
@@ -85,7 +94,8 @@ class EChartsUtils:
         if chart_type not in cls.CHART_TEMPLATES:
             raise ValueError(f"不支持的图表类型: {chart_type}")
         
-        config = cls.CHART_TEMPLATES[chart_type].copy()
+        # 深拷贝模板，避免填充数据时修改共享模板
+        config = copy.deepcopy(cls.CHART_TEMPLATES[chart_type])
         
         # 设置标题
         if title:
@@ -99,6 +109,14 @@ class EChartsUtils:
         if data:
             config = cls._fill_data(config, chart_type, data)
         
+        # 数值量化和 dataset 编码
+        if significant_digits is None:
+            significant_digits = settings.CHART_SIGNIFICANT_DIGITS
+        if significant_digits is not None or precision:
+            config = cls.quantize_config(config, significant_digits, precision)
+        if (data_format or settings.CHART_DATA_FORMAT) == "dataset":
+            config = cls._to_dataset(config, chart_type)
+        
         return config
     
     @classmethod
@@ -132,16 +150,181 @@ class EChartsUtils:
                     config["series"] = data["series"]
                 elif isinstance(data["series"], dict) and "data" in data["series"]:
                     config["series"][0]["data"] = data["series"]["data"]
+            # 散点分箱结果通过 visualMap 按数量映射气泡大小或颜色
+            if "visualMap" in data:
+                config["visualMap"] = data["visualMap"]
+        
+        return config
+    
+    @classmethod
+    def _to_dataset(cls, config: Dict[str, Any], chart_type: str) -> Dict[str, Any]:
+        """
+        将 series 中的数据转换为共享的列式 dataset.source，series 通过 encode 引用列
+        
+        只转换折线图、柱状图和饼图中由标量（饼图为 name/value 对象）组成的数据，
+        其他情况保持原样。配置、series 和 xAxis 都是浅拷贝后再修改，调用方传入的数据和缓存的配置不受影响。
+        
+        Args:
+            config: 已填充数据的配置
+            chart_type: 图表类型
+            
+        Returns:
+            转换后的配置
+        """
+        series_list = config.get("series")
+        if not isinstance(series_list, list) or not series_list:
+            return config
+        
+        if chart_type == "pie":
+            items = series_list[0].get("data")
+            if not isinstance(items, list) or not all(
+                isinstance(item, dict) and set(item) == {"name", "value"} for item in items
+            ):
+                return config
+            pie_series = {key: value for key, value in series_list[0].items() if key != "data"}
+            pie_series["encode"] = {"itemName": "name", "value": "value"}
+            config = dict(config)
+            config["series"] = [pie_series] + series_list[1:]
+            config["dataset"] = {"source": {
+                "name": [item["name"] for item in items],
+                "value": [item["value"] for item in items]
+            }}
+            return config
+        
+        if chart_type not in ("line", "bar") or not isinstance(config.get("xAxis"), dict):
+            return config
+        for series in series_list:
+            data = series.get("data") if isinstance(series, dict) else None
+            if not isinstance(data, list) or any(isinstance(v, (dict, list)) for v in data):
+                return config
+        
+        # 维度名使用 series 名称，重名或缺失时自动生成
+        names = []
+        for i, series in enumerate(series_list):
+            name = str(series.get("name") or f"series{i + 1}")
+            while name in names:
+                name += "_"
+            names.append(name)
+        x_dim = "x"
+        while x_dim in names:
+            x_dim = "_" + x_dim
+        
+        config = dict(config)
+        x_axis = dict(config["xAxis"])
+        source = {x_dim: x_axis.pop("data", [])}
+        config["xAxis"] = x_axis
+        config["series"] = []
+        for name, series in zip(names, series_list):
+            series = dict(series)
+            source[name] = series.pop("data")
+            series.setdefault("type", chart_type)
+            series["name"] = name
+            series["encode"] = {"x": x_dim, "y": name}
+            config["series"].append(series)
+        config["dataset"] = {"source": source}
+        return config
+    
+    @classmethod
+    def quantize_config(cls, config: Dict[str, Any], significant_digits: Optional[int] = None,
+                        precision: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        对配置中 series 数据和 dataset.source 的数值进行量化
+        
+        precision 中按列名（series 名称）指定了小数位数的列统一保留该位数，
+        其他列的每个数值保留 significant_digits 位有效数字。
+        
+        Args:
+            config: 图表配置
+            significant_digits: 有效数字位数
+            precision: 按列名指定的小数位数
+            
+        Returns:
+            量化后的配置
+        """
+        precision = precision or {}
+        
+        series_list = config.get("series")
+        if isinstance(series_list, dict):
+            series_list = [series_list]
+        for series in series_list if isinstance(series_list, list) else []:
+            if isinstance(series, dict) and isinstance(series.get("data"), list):
+                series["data"] = cls._quantize_column(
+                    series["data"], significant_digits, precision.get(series.get("name"))
+                )
+        
+        dataset = config.get("dataset")
+        source = dataset.get("source") if isinstance(dataset, dict) else None
+        if isinstance(source, dict):
+            for name, column in source.items():
+                if isinstance(column, list):
+                    source[name] = cls._quantize_column(column, significant_digits, precision.get(name))
         
         return config
     
     @classmethod
-    def optimize_config(cls, config: Dict[str, Any]) -> Dict[str, Any]:
+    def _quantize_column(cls, values: List[Any], significant_digits: Optional[int],
+                         decimals: Optional[int] = None) -> List[Any]:
+        """
+        量化一列数值
+        
+        支持标量、[x, y] 形式的点（每个维度单独确定小数位）以及带 value 字段的对象。
+        
+        Args:
+            values: 数值列表
+            significant_digits: 有效数字位数
+            decimals: 指定的小数位数，优先于 significant_digits
+            
+        Returns:
+            量化后的列表
+        """
+        if not values:
+            return values
+        
+        first = next((v for v in values if v is not None), None)
+        if isinstance(first, list):
+            width = max(len(v) for v in values if isinstance(v, list))
+            dims = [
+                cls._quantize_column([v[i] if isinstance(v, list) and i < len(v) else None for v in values],
+                                     significant_digits, decimals)
+                for i in range(width)
+            ]
+            return [
+                [dims[i][row] for i in range(len(v))] if isinstance(v, list) else v
+                for row, v in enumerate(values)
+            ]
+        if isinstance(first, dict):
+            quantized = cls._quantize_column(
+                [v.get("value") if isinstance(v, dict) else None for v in values], significant_digits, decimals
+            )
+            return [
+                {**v, "value": q} if isinstance(v, dict) and "value" in v else v
+                for v, q in zip(values, quantized)
+            ]
+        
+        if decimals is None and significant_digits is None:
+            return values
+        
+        def quantize(v: Any) -> Any:
+            if not isinstance(v, (int, float)) or isinstance(v, bool) or not math.isfinite(v) or v == 0:
+                return v
+            places = decimals
+            if places is None:
+                places = significant_digits - 1 - math.floor(math.log10(abs(v)))
+            if isinstance(v, int) and places >= 0:
+                return v
+            rounded = round(v, places)
+            return int(rounded) if places <= 0 else rounded
+        
+        return [quantize(v) for v in values]
+    
+    @classmethod
+    def optimize_config(cls, config: Dict[str, Any], profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         优化图表配置
         
         Args:
             config: 原始配置
+            profile: DataProcessor.profile_data 返回的数据概况，为空时按配置中的数据计算（按内容哈希缓存）
             
         Returns:
             优化后的配置
@@ -150,6 +333,17 @@ class EChartsUtils:
         config.setdefault("responsive", True)
         config.setdefault("animation", True)
         
+        # 根据数据概况选择坐标轴类型和范围
+        if settings.AXIS_AUTO_SCALE_ENABLED:
+            if profile is None:
+                view = cls._profile_view(config)
+                profile = DataProcessor.profile_data(view) if view is not None else None
+            if profile:
+                cls._apply_profile(config, profile)
+        
+        # 大数据量优化
+        cls._optimize_large_data(config)
+        
         # 优化 tooltip
         if "tooltip" not in config:
             config["tooltip"] = {
@@ -168,6 +362,246 @@ class EChartsUtils:
         
         return config
     
+    @classmethod
+    def _axes(cls, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        识别直角坐标系的类目轴和数值轴，只处理单个 xAxis 和 yAxis
+        
+        Returns:
+            {"category": 类目轴键名或 None, "value": 数值轴键名, "series": series 列表}，无坐标轴时返回 None
+        """
+        x_axis, y_axis = config.get("xAxis"), config.get("yAxis")
+        series_list = config.get("series")
+        if isinstance(series_list, dict):
+            series_list = [series_list]
+        if not isinstance(x_axis, dict) or not isinstance(y_axis, dict) or not isinstance(series_list, list):
+            return None
+        if x_axis.get("type", "category") == "category":
+            category = "xAxis"
+        elif y_axis.get("type", "value") == "category":
+            category = "yAxis"
+        else:
+            category = None
+        return {
+            "category": category,
+            "value": "xAxis" if category == "yAxis" else "yAxis",
+            "series": [series for series in series_list if isinstance(series, dict)]
+        }
+    
+    @classmethod
+    def _profile_view(cls, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        从配置中取出类目轴数据和各 series 数据（不复制数组），作为计算数据概况的输入
+        
+        使用列式 dataset 时按 encode 取对应的列。
+        
+        Args:
+            config: 图表配置
+            
+        Returns:
+            与 process_data 输出格式相同的数据，没有直角坐标系时返回 None
+        """
+        axes = cls._axes(config)
+        if axes is None:
+            return None
+        
+        dataset = config.get("dataset")
+        if isinstance(dataset, list):
+            dataset = dataset[0] if dataset else None
+        source = dataset.get("source") if isinstance(dataset, dict) else None
+        if not isinstance(source, dict):
+            source = {}
+        value_dim = "x" if axes["category"] == "yAxis" else "y"
+        category_dim = "y" if axes["category"] == "yAxis" else "x"
+        
+        view: Dict[str, Any] = {"series": []}
+        category_data = config[axes["category"]].get("data") if axes["category"] else None
+        for series in axes["series"]:
+            data = series.get("data")
+            encode = series.get("encode")
+            if data is None and isinstance(encode, dict):
+                data = source.get(encode.get(value_dim))
+                if category_data is None and axes["category"]:
+                    category_data = source.get(encode.get(category_dim))
+            view["series"].append({"name": series.get("name"), "data": data})
+        if isinstance(category_data, list):
+            view["xAxis"] = category_data
+        return view
+    
+    @classmethod
+    def _apply_profile(cls, config: Dict[str, Any], profile: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        根据数据概况设置坐标轴
+        
+        只调整折线图和散点图。数值轴：数值全为正且跨越 AXIS_LOG_SCALE_RATIO 倍以上时改为对数轴，
+        远离 0 时设置 scale，不强制包含 0。类目轴：x 列全是有序的日期时间时改为时间轴（范围为
+        dataMin/dataMax），全是有序但间距不等的数值时改为数值轴，并以数据的最小/最大值作为轴范围。
+        已设置 min、max、scale 或 logBase 的坐标轴不做修改。
+        
+        Args:
+            config: 图表配置
+            profile: 数据概况
+            
+        Returns:
+            修改后的配置
+        """
+        axes = cls._axes(config)
+        if axes is None:
+            return config
+        series_types = {series.get("type") for series in axes["series"]}
+        continuous = series_types <= {"line", "scatter"}
+        
+        cls._scale_value_axis(config[axes["value"]], profile.get("y"), continuous)
+        if axes["category"] is None:
+            # 散点图等两个数值轴的图表，x 列同样按数值范围缩放
+            cls._scale_value_axis(config["xAxis"], profile.get("x"), continuous)
+            return config
+        
+        x = profile.get("x")
+        category_axis = config[axes["category"]]
+        if (axes["category"] != "xAxis" or not continuous or not x or x["nulls"] or x["monotonic"] is None
+                or any(key in category_axis for key in ("min", "max"))):
+            return config
+        if x["dtype"] == "datetime":
+            axis_type = "time"
+        elif x["dtype"] == "number" and not x["evenly_spaced"]:
+            # 等距的数值类目（如连续年份）按类目轴显示效果相同，保持不变
+            axis_type = "value"
+        else:
+            return config
+        
+        if cls._category_to_pairs(config, category_axis, axes["series"]):
+            category_axis["type"] = axis_type
+            if axis_type == "time":
+                # 浏览器按本地时区解析不含时区的日期字符串，用 UTC 时间戳作为边界会裁掉首尾的点
+                category_axis["min"] = "dataMin"
+                category_axis["max"] = "dataMax"
+            else:
+                category_axis["min"] = x["min"]
+                category_axis["max"] = x["max"]
+        return config
+    
+    @classmethod
+    def _scale_value_axis(cls, axis: Dict[str, Any], column: Optional[Dict[str, Any]], continuous: bool) -> None:
+        """按数值列的范围设置对数轴或 scale"""
+        if (not column or column["dtype"] != "number" or axis.get("type", "value") != "value"
+                or any(key in axis for key in ("min", "max", "scale", "logBase"))):
+            return
+        if not continuous:
+            # 柱状图的长度必须从 0 开始才能按比例比较，不使用对数轴或 scale
+            return
+        low, high = column["min"], column["max"]
+        if low > 0 and high / low >= settings.AXIS_LOG_SCALE_RATIO:
+            axis["type"] = "log"
+            axis["logBase"] = 10
+        elif ((low > 0 and low / high >= settings.AXIS_SCALE_MIN_RATIO)
+                             or (high < 0 and high / low >= settings.AXIS_SCALE_MIN_RATIO)):
+            axis["scale"] = True
+    
+    @classmethod
+    def _category_to_pairs(cls, config: Dict[str, Any], axis: Dict[str, Any], series_list: List[Dict[str, Any]]) -> bool:
+        """
+        把类目轴数据并入各 series，得到时间轴/数值轴所需的 [x, y] 数据
+        
+        使用 dataset 时 series 通过 encode 取列，无需转换。
+        
+        Returns:
+            能否改为时间轴或数值轴
+        """
+        categories = axis.get("data")
+        if not isinstance(categories, list):
+            return "dataset" in config and all(isinstance(series.get("encode"), dict) for series in series_list)
+        for series in series_list:
+            data = series.get("data")
+            if (not isinstance(data, list) or len(data) != len(categories)
+                    or any(isinstance(v, (dict, list)) for v in data)):
+                return False
+        for series in series_list:
+            series["data"] = [list(pair) for pair in zip(categories, series["data"])]
+        del axis["data"]
+        return True
+    
+    @classmethod
+    def _optimize_large_data(cls, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        根据数据量开启 ECharts 的大数据渲染特性
+        
+        数据点数超过 LARGE_DATA_THRESHOLD 的 series 会关闭动画和标记点，
+        开启 large 和 progressive 渲染，折线图使用 LTTB 降采样；
+        类目数超过 DATAZOOM_CATEGORY_THRESHOLD 的类目轴添加 dataZoom。
+        已有的配置项不会被覆盖。
+        
+        Args:
+            config: 图表配置
+            
+        Returns:
+            优化后的配置
+        """
+        threshold = settings.LARGE_DATA_THRESHOLD
+        series_list = config.get("series")
+        if isinstance(series_list, dict):
+            series_list = [series_list]
+        if not isinstance(series_list, list):
+            series_list = []
+        
+        # 使用 dataset 时 series 没有 data，以 dataset.source 的行数为准
+        dataset = config.get("dataset")
+        if isinstance(dataset, list):
+            dataset = dataset[0] if dataset else None
+        dataset_size = 0
+        if isinstance(dataset, dict) and isinstance(dataset.get("source"), (list, dict)):
+            source = dataset["source"]
+            if isinstance(source, dict):
+                dataset_size = max((len(v) for v in source.values() if isinstance(v, list)), default=0)
+            else:
+                dataset_size = max(len(source) - 1, 0)
+        
+        large_data = False
+        for series in series_list:
+            if not isinstance(series, dict):
+                continue
+            data = series.get("data")
+            size = len(data) if isinstance(data, list) else dataset_size
+            if size < threshold:
+                continue
+            
+            large_data = True
+            series_type = series.get("type")
+            if series_type == "line":
+                series.setdefault("showSymbol", False)
+                series.setdefault("sampling", "lttb")
+            elif series_type in ("bar", "scatter"):
+                series.setdefault("large", True)
+                series.setdefault("largeThreshold", threshold)
+            series.setdefault("progressive", settings.PROGRESSIVE_CHUNK_SIZE)
+            series.setdefault("progressiveThreshold", threshold)
+        
+        if large_data:
+            config["animation"] = False
+        
+        # 类目过多时添加 dataZoom，只渲染可见窗口
+        if "dataZoom" not in config:
+            for axis_key in ("xAxis", "yAxis"):
+                axis = config.get(axis_key)
+                if isinstance(axis, list):
+                    axis = axis[0] if axis else None
+                default_type = "category" if axis_key == "xAxis" else "value"
+                if not isinstance(axis, dict) or axis.get("type", default_type) != "category":
+                    continue
+                
+                axis_data = axis.get("data")
+                count = len(axis_data) if isinstance(axis_data, list) else (dataset_size if axis_key == "xAxis" else 0)
+                if count > settings.DATAZOOM_CATEGORY_THRESHOLD:
+                    end = round(settings.DATAZOOM_CATEGORY_THRESHOLD / count * 100, 2)
+                    axis_index = "xAxisIndex" if axis_key == "xAxis" else "yAxisIndex"
+                    config["dataZoom"] = [
+                        {"type": "inside", axis_index: 0, "start": 0, "end": end},
+                        {"type": "slider", axis_index: 0, "start": 0, "end": end}
+                    ]
+                    break
+        
+        return config
+    
     @classmethod
     def generate_html(cls, config: Dict[str, Any], height: str = "400px") -> str:
         """
@@ -205,7 +639,7 @@ class EChartsUtils:
         '''
         
         # 使用字符串格式化替换变量
-        config_str = json.dumps(config, ensure_ascii=False)
+        config_str = json.dumps(config, ensure_ascii=False, separators=(",", ":"))
         html = html_template.format(
             echarts_version=settings.ECHARTS_VERSION,
             height=height,
@@ -214,6 +648,111 @@ class EChartsUtils:
         
         return html
 
+    @classmethod
+    def generate_dashboard_html(cls, configs: List[Dict[str, Any]], title: str = "ECharts 仪表板",
+                                height: str = "400px", columns: int = 1) -> str:
+        """
+        生成包含多个图表的单页 HTML
+        
+        ECharts 只加载一次，所有配置以一个紧凑的 JSON 块嵌入页面。图表滚动到可视区域附近时
+        才初始化，离开后销毁，打开包含上百个图表的页面时只渲染当前可见的几个。
+        
+        Args:
+            configs: 图表配置列表
+            title: 页面标题
+            height: 每个图表的高度
+            columns: 每行的图表数
+            
+        Returns:
+            HTML 字符串
+        """
+        html_template = '''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title}</title>
+    <script src="https://cdn.jsdelivr.net/npm/echarts@{echarts_version}/dist/echarts.min.js"></script>
+    <style>
+        body {{ margin: 16px; font-family: sans-serif; }}
+        #dashboard {{ display: grid; grid-template-columns: repeat({columns}, minmax(0, 1fr)); gap: 16px; }}
+        .chart {{ height: {height}; }}
+    </style>
+</head>
+<body>
+    <h2>{title}</h2>
+    <div id="dashboard"></div>
+    <script type="application/json" id="dashboard-configs">{configs}</script>
+    <script>
+        var configs = JSON.parse(document.getElementById('dashboard-configs').textContent);
+        var dashboard = document.getElementById('dashboard');
+        var charts = {{}};
+        var containers = [];
+        for (var i = 0; i < configs.length; i++) {{
+            var container = document.createElement('div');
+            container.className = 'chart';
+            container.dataset.index = i;
+            dashboard.appendChild(container);
+            containers.push(container);
+        }}
+
+        function show(container) {{
+            var index = container.dataset.index;
+            if (!charts[index]) {{
+                charts[index] = echarts.init(container);
+                charts[index].setOption(configs[index]);
+            }}
+        }}
+
+        function hide(container) {{
+            var index = container.dataset.index;
+            if (charts[index]) {{
+                charts[index].dispose();
+                delete charts[index];
+            }}
+        }}
+
+        if ('IntersectionObserver' in window) {{
+            // 进入可视区域附近时初始化，离开后销毁以释放画布和内存
+            var observer = new IntersectionObserver(function (entries) {{
+                entries.forEach(function (entry) {{
+                    if (entry.isIntersecting) {{
+                        show(entry.target);
+                    }} else {{
+                        hide(entry.target);
+                    }}
+                }});
+            }}, {{ rootMargin: '200px 0px' }});
+            containers.forEach(function (container) {{ observer.observe(container); }});
+        }} else {{
+            containers.forEach(show);
+        }}
+
+        var resizePending = false;
+        window.addEventListener('resize', function () {{
+            if (resizePending) return;
+            resizePending = true;
+            requestAnimationFrame(function () {{
+                resizePending = false;
+                for (var index in charts) {{
+                    charts[index].resize();
+                }}
+            }});
+        }});
+    </script>
+</body>
+</html>
+'''
+        # 嵌入 script 标签时转义 "</"，避免配置中的字符串提前结束标签
+        configs_str = json.dumps(configs, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+        return html_template.format(
+            title=escape(title),
+            echarts_version=settings.ECHARTS_VERSION,
+            columns=columns,
+            height=height,
+            configs=configs_str
+        )
+    
     @classmethod
     def generate_and_open_chart(cls, config: Dict[str, Any], height: str = "400px") -> Dict[str, Any]:
         """
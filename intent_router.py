@@ -0,0 +1,359 @@
+import re
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, List, Tuple
+
+
+# 图表类型关键词，按长度从长到短匹配
+CHART_KEYWORDS = {
+    "line": ["line chart", "line graph", "line plot", "折线图", "趋势图", "曲线图", "折线", "line"],
+    "bar": ["bar chart", "bar graph", "column chart", "柱状图", "柱形图", "条形图", "柱状", "bar"],
+    "pie": ["pie chart", "饼状图", "饼图", "pie"],
+    "scatter": ["scatter plot", "scatter chart", "散点图", "scatter"],
+}
+
+# 主题关键词
+THEME_KEYWORDS = {
+    "dark": ["dark theme", "dark mode", "暗色主题", "深色主题", "黑色主题", "暗色", "深色", "dark"],
+    "light": ["light theme", "light mode", "浅色主题", "亮色主题", "浅色", "亮色", "light"],
+}
+
+# 不影响图表意图的词
+_EN_FILLER = frozenset({
+    "a", "an", "the", "of", "for", "with", "and", "show", "showing", "me", "create", "make",
+    "draw", "plot", "generate", "give", "please", "chart", "graph", "theme", "using", "use",
+    "in", "on", "to", "i", "want", "need", "simple", "basic", "data", "by", "per", "over",
+    "across", "vs", "versus", "against",
+})
+_CJK_FILLER = ("生成", "创建", "绘制", "展示", "显示", "一个", "一张", "帮我", "请", "画", "做", "的", "图表", "主题", "图", "用", "和", "与")
+
+# 表示 x 轴维度的短语（如 by month、按月），数据的 xAxis 没有列名时用它们解释 x 轴
+_X_REFERENCE_PATTERN = re.compile(r"\b(?:by|per|over|across)\s+[a-z]+|按[一-鿿]{1,4}?(?=[的,，。\s]|$)")
+_TIME_WORDS = ("daily", "weekly", "monthly", "quarterly", "yearly", "annual", "每日", "每周", "每月", "每季度", "每年",
+               "月度", "年度", "季度")
+
+# 显式标题
+_TITLE_PATTERNS = [
+    re.compile(r"(?:titled|title:?)\s*[\"'“”‘’「《]?([^\"'“”‘’」》,，。]+)", re.IGNORECASE),
+    re.compile(r"标题(?:为|是|：|:)\s*[\"'“”‘’「《]?([^\"'“”‘’」》,，。]+)"),
+    re.compile(r"[\"“「《]([^\"”」》]+)[\"”」》]"),
+]
+
+# 规则路径无法实现的图表修饰词，未被列名解释时出现任意一个都交给 DeepSeek
+_MODIFIER_PATTERN = re.compile(
+    r"\b(?:stack(?:ed|ing)?|horizontal(?:ly)?|smooth(?:ed|ly)?|donut|doughnut|ring|rose|nightingale"
+    r"|log(?:arithmic)?|area|percent(?:age)?s?|normali[sz]ed|cumulative|dual|secondary|sort(?:ed)?"
+    r"|descending|ascending|labels?|gradient|animat(?:ed|ion)|step)\b"
+    r"|%|堆叠|横向|水平|平滑|环形|圆环|玫瑰|南丁格尔|对数|面积|百分比|占比|累计|双轴|排序|降序|升序|标签|渐变|动画|阶梯"
+)
+
+# 规则路径无法实现的排除和计算（规则路径会原样绘制所有提到的列），出现任意一个都交给 DeepSeek；
+# per 和“每”后面是时间单位时表示 x 轴（如 per month），其余情况（如 revenue per customer）表示计算
+_OPERATION_PATTERN = re.compile(
+    r"\b(?:without|exclud(?:e|es|ed|ing)|except(?:ing)?|minus|subtract(?:ed|ing)?|differences?|diff"
+    r"|ratios?|divided|averages?|averaged|avg|mean|totals?|sum|vs|versus)\b"
+    r"|\bper\s+(?!(?:hour|day|week|month|quarter|year)s?\b)[a-z]+"
+    r"|不含|不包含|不包括|除了|除去|排除|去掉|不要|减去|差值|差额|之差|比率|比值|比例|平均|均值|总计|合计|总和|总额"
+    r"|人均|对比|相比|每(?![日天周月年季度])[一-鿿]"
+)
+
+_UNIT_PATTERN = re.compile(r"[a-z]+|\d+(?:\.\d+)?|[一-鿿]")
+
+
+def _find_keyword(text: str, keywords: Dict[str, List[str]]) -> Tuple[List[str], List[str]]:
+    """
+    在文本中查找关键词
+
+    Returns:
+        (命中的类别列表, 命中的关键词列表)
+    """
+    kinds = []
+    matched = []
+    for kind, words in keywords.items():
+        for word in words:
+            pattern = rf"\b{re.escape(word)}\b" if word.isascii() else re.escape(word)
+            if re.search(pattern, text):
+                kinds.append(kind)
+                matched.append(word)
+                break
+    return kinds, matched
+
+
+def _column_variants(name: str) -> List[str]:
+    """列名在提示中可能出现的形式（复数、-ly 形容词）"""
+    name = name.lower().strip()
+    if not name:
+        return []
+    variants = [name]
+    if name.isascii():
+        variants += [name + "s", name + "es", name + "ly"]
+        if name.endswith("s"):
+            variants.append(name[:-1])
+    return variants
+
+
+def _strip_cjk_filler(text: str) -> str:
+    """去掉中文填充词"""
+    for word in _CJK_FILLER:
+        text = text.replace(word, " ")
+    return text
+
+
+def _count_units(text: str) -> int:
+    """统计文本中的有效词数：英文按单词、数字按整体、中文按字，不计填充词"""
+    count = 0
+    for unit in _UNIT_PATTERN.findall(text):
+        if unit.isascii() and unit in _EN_FILLER:
+            continue
+        count += 1
+    return count
+
+
+class IntentRouter:
+    """基于规则的图表意图解析器，简单提示直接本地生成配置，无法确定时交给 DeepSeek"""
+
+    def __init__(self, min_confidence: Optional[float] = None, history_size: int = 100):
+        """
+        初始化路由器
+
+        Args:
+            min_confidence: 走本地规则所需的最低置信度，默认使用 settings.INTENT_ROUTER_MIN_CONFIDENCE
+            history_size: 保留的最近路由决策数量
+        """
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._decisions = deque(maxlen=history_size)
+        self._counts = {"rules": 0, "deepseek": 0}
+        self._latency = {"rules": 0.0, "deepseek": 0.0}
+
+    def parse(self, prompt: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        解析提示中的图表意图
+
+        Args:
+            prompt: 用户提示
+            data: 数据集
+
+        Returns:
+            意图，包含 chart_type、title、theme、data、confidence 和 reason
+        """
+        intent = {"chart_type": None, "title": "", "theme": "light", "data": None,
+                  "confidence": 0.0, "reason": ""}
+        text = prompt.lower()
+        total_units = _count_units(_strip_cjk_filler(text))
+        if total_units == 0:
+            intent["reason"] = "提示为空"
+            return intent
+
+        # 先取出显式标题，避免标题中的词被当作未识别内容
+        title = None
+        for pattern in _TITLE_PATTERNS:
+            match = pattern.search(prompt)
+            if match:
+                title = match.group(1).strip()
+                text = text.replace(match.group(0).lower(), " ")
+                break
+
+        chart_types, chart_words = _find_keyword(text, CHART_KEYWORDS)
+        if len(chart_types) != 1:
+            intent["reason"] = "未识别出图表类型" if not chart_types else "提示中包含多种图表类型"
+            return intent
+        chart_type = chart_types[0]
+        intent["chart_type"] = chart_type
+
+        themes, theme_words = _find_keyword(text, THEME_KEYWORDS)
+        if len(themes) > 1:
+            intent["reason"] = "提示中包含多种主题"
+            return intent
+        if themes:
+            intent["theme"] = themes[0]
+
+        remaining = text
+        for word in chart_words + theme_words:
+            remaining = remaining.replace(word, " ")
+        title_source = remaining
+
+        if not data:
+            intent["reason"] = "没有提供数据"
+            return intent
+
+        chart_data, column_words, has_unnamed_x = self._select_columns(chart_type, remaining, data)
+        if chart_data is None:
+            intent["reason"] = "无法从数据中确定 x 轴和数值列"
+            return intent
+        intent["data"] = chart_data
+
+        for word in sorted(column_words, key=len, reverse=True):
+            remaining = re.sub(rf"\b{re.escape(word)}\b" if word.isascii() else re.escape(word), " ", remaining)
+        # 排除和计算在去掉 x 轴短语之前检查，避免 per customer 被当作 x 轴描述
+        operation = _OPERATION_PATTERN.search(remaining)
+        if has_unnamed_x:
+            remaining = _X_REFERENCE_PATTERN.sub(" ", remaining)
+            for word in _TIME_WORDS:
+                remaining = remaining.replace(word, " ")
+        remaining = _strip_cjk_filler(remaining)
+
+        # 用户要求的修饰、排除和计算无论提示多长都不能被忽略
+        modifier = _MODIFIER_PATTERN.search(remaining)
+        if modifier:
+            intent["reason"] = f"提示中包含规则路径无法实现的修饰: {modifier.group(0)}"
+            return intent
+        if operation:
+            intent["reason"] = f"提示中包含规则路径无法实现的排除或计算: {operation.group(0).strip()}"
+            return intent
+        
+        # 所有有效词都被解释时置信度为 1，每个无法解释的词都会降低置信度
+        unexplained = _count_units(remaining)
+        intent["confidence"] = round(1 - unexplained / total_units, 3)
+        intent["title"] = title if title is not None else self._derive_title(prompt, title_source)
+        intent["reason"] = "已解析" if unexplained == 0 else f"有 {unexplained} 个词无法解释"
+        return intent
+
+    def route(self, prompt: str, data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        判断是否可以走本地规则
+
+        Args:
+            prompt: 用户提示
+            data: 数据集
+
+        Returns:
+            置信度足够时返回意图，否则返回 None（应交给 DeepSeek）
+        """
+        from config import settings
+
+        min_confidence = self.min_confidence
+        if min_confidence is None:
+            min_confidence = settings.INTENT_ROUTER_MIN_CONFIDENCE
+
+        intent = self.parse(prompt, data)
+        use_rules = intent["data"] is not None and intent["confidence"] >= min_confidence
+        with self._lock:
+            self._decisions.append({
+                "prompt": prompt[:200],
+                "route": "rules" if use_rules else "deepseek",
+                "chart_type": intent["chart_type"],
+                "confidence": intent["confidence"],
+                "reason": intent["reason"]
+            })
+        return intent if use_rules else None
+
+    def record(self, route: str, elapsed: float) -> None:
+        """
+        记录一次请求的路由结果和耗时
+
+        Args:
+            route: rules 或 deepseek
+            elapsed: 耗时（秒）
+        """
+        with self._lock:
+            self._counts[route] += 1
+            self._latency[route] += elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        """返回路由命中率、平均耗时和最近的路由决策"""
+        with self._lock:
+            total = sum(self._counts.values())
+            return {
+                "total": total,
+                "rules": self._counts["rules"],
+                "deepseek": self._counts["deepseek"],
+                "hit_rate": self._counts["rules"] / total if total else 0.0,
+                "avg_latency": {
+                    route: self._latency[route] / count if count else None
+                    for route, count in self._counts.items()
+                },
+                "recent_decisions": list(self._decisions)
+            }
+
+    @classmethod
+    def _select_columns(cls, chart_type: str, text: str,
+                        data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str], bool]:
+        """
+        根据提示和数据结构确定 x 轴和数值列，并转换为 create_chart_config 所需格式
+
+        支持 {"xAxis": [...], "series": [...]}、饼图 {"data": [{"name", "value"}]}
+        以及记录列表 {"data": [{列名: 值}, ...]} 三种格式。
+
+        Returns:
+            (图表数据, 提示中被解释的列名, x 轴是否没有列名)
+        """
+        def mentioned(name: str) -> Optional[str]:
+            for variant in _column_variants(str(name)):
+                pattern = rf"\b{re.escape(variant)}\b" if variant.isascii() else re.escape(variant)
+                if re.search(pattern, text):
+                    return variant
+            return None
+
+        # 已是 ECharts 数据格式
+        if isinstance(data.get("series"), list):
+            series = [s for s in data["series"] if isinstance(s, dict) and "data" in s]
+            if not series or chart_type == "pie":
+                return None, [], False
+            words = []
+            selected = []
+            for s in series:
+                word = mentioned(s.get("name", ""))
+                if word:
+                    words.append(word)
+                    selected.append(s)
+            # 提示中没有提到任何列名时使用全部 series
+            selected = selected or series
+            chart_data = {"series": [dict(s) for s in selected]}
+            if "xAxis" in data:
+                chart_data["xAxis"] = data["xAxis"]
+            return chart_data, words, "xAxis" in data
+
+        records = data.get("data")
+        if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+            return None, [], False
+
+        columns = list(records[0].keys())
+        if chart_type == "pie" and {"name", "value"} <= set(columns):
+            return {"data": records}, [], True
+
+        numeric = [c for c in columns if all(isinstance(r.get(c), (int, float)) and not isinstance(r.get(c), bool)
+                                             for r in records)]
+        categorical = [c for c in columns if c not in numeric]
+        words = {c: mentioned(c) for c in columns}
+
+        if chart_type == "scatter":
+            values = [c for c in numeric if words[c]] or numeric
+            if len(values) < 2:
+                return None, [], False
+            x_col, y_col = values[0], values[1]
+            chart_data = {"series": [{"name": y_col, "data": [[r[x_col], r[y_col]] for r in records]}]}
+            return chart_data, [w for c, w in words.items() if w and c in (x_col, y_col)], False
+
+        x_candidates = [c for c in categorical if words[c]] or categorical
+        if len(x_candidates) != 1:
+            return None, [], False
+        x_col = x_candidates[0]
+        values = [c for c in numeric if words[c]] or numeric
+        if not values or (chart_type == "pie" and len(values) != 1):
+            return None, [], False
+
+        used_words = [w for c, w in words.items() if w and (c == x_col or c in values)]
+        if chart_type == "pie":
+            chart_data = {"data": [{"name": str(r[x_col]), "value": r[values[0]]} for r in records]}
+        else:
+            chart_data = {
+                "xAxis": [str(r[x_col]) for r in records],
+                "series": [{"name": c, "data": [r[c] for r in records]} for c in values]
+            }
+        return chart_data, used_words, False
+
+    @staticmethod
+    def _derive_title(prompt: str, title_source: str) -> str:
+        """没有显式标题时，用去掉图表类型、主题和指令词后的提示作为标题"""
+        if not title_source.strip():
+            return ""
+        text = _strip_cjk_filler(title_source)
+        words = [w for w in re.split(r"[\s,，。.!！?？]+", text) if w]
+        # 去掉开头的指令词和介词
+        while words and words[0] in _EN_FILLER:
+            words.pop(0)
+        while words and words[-1] in _EN_FILLER:
+            words.pop()
+        title = " ".join(words) if prompt.isascii() else "".join(words)
+        return title[:1].upper() + title[1:]
@@ -0,0 +1,338 @@
+import json
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# 常见的 ECharts 顶层字段，用于在多个候选对象中挑选配置对象
+ECHARTS_KEYS = frozenset({
+    "series", "xAxis", "yAxis", "title", "tooltip", "legend", "grid", "dataset",
+    "dataZoom", "visualMap", "radar", "polar", "geo", "color", "toolbox",
+})
+
+# JS 字面量
+_LITERALS = {
+    "true": True, "false": False, "null": None, "undefined": None,
+    "NaN": None, "Infinity": None,
+}
+
+_FENCE_PATTERN = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+_NUMBER_PATTERN = re.compile(
+    r"[+-]?(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|Infinity)"
+)
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_$][\w$]*")
+# 数字之后、输入结束之前只有不完整的指数或十六进制前缀
+_PARTIAL_NUMBER_TAIL = re.compile(r"(?:[eE][+-]?|[xX])\s*")
+
+# 表示跳过的值（函数、new 表达式等无法转换为 JSON 的内容）
+_SKIP = object()
+
+
+class _Truncated(Exception):
+    """输入在一个标量值中间结束"""
+
+
+class JSONExtractError(ValueError):
+    """无法从模型输出中提取对象"""
+
+    def __init__(self, message: str, pos: Optional[int] = None):
+        """
+        Args:
+            message: 错误信息
+            pos: 出错位置（在完整输出中的下标），错误与具体位置无关时为 None
+        """
+        super().__init__(message if pos is None else f"{message} (位置 {pos})")
+        self.message = message
+        self.pos = pos
+
+
+class _LenientParser:
+    """
+    宽松的 JS 对象字面量解析器
+
+    支持未加引号的键、单引号字符串、尾随逗号、注释，跳过函数等无法转换为 JSON 的值，
+    输入被截断时自动补全未闭合的对象和数组。
+    """
+
+    def __init__(self, text: str, pos: int = 0):
+        self.text = text
+        self.pos = pos
+        self.truncated = False
+
+    def parse(self) -> Any:
+        """从当前位置解析一个值"""
+        return self._parse_value()
+
+    def _error(self, message: str) -> JSONExtractError:
+        return JSONExtractError(message, self.pos)
+
+    def _at_end(self) -> bool:
+        return self.pos >= len(self.text)
+
+    def _skip_whitespace(self) -> None:
+        """跳过空白和 // 、/* */ 注释"""
+        text = self.text
+        while self.pos < len(text):
+            c = text[self.pos]
+            if c.isspace():
+                self.pos += 1
+            elif text.startswith("//", self.pos):
+                end = text.find("\n", self.pos)
+                self.pos = len(text) if end == -1 else end + 1
+            elif text.startswith("/*", self.pos):
+                end = text.find("*/", self.pos + 2)
+                self.pos = len(text) if end == -1 else end + 2
+            else:
+                break
+
+    def _parse_value(self) -> Any:
+        self._skip_whitespace()
+        if self._at_end():
+            raise _Truncated()
+
+        c = self.text[self.pos]
+        if c == "{":
+            return self._parse_object()
+        if c == "[":
+            return self._parse_array()
+        if c in "\"'`":
+            return self._parse_string()
+        if c.isdigit() or c in "+-.":
+            return self._parse_number()
+
+        match = _IDENTIFIER_PATTERN.match(self.text, self.pos)
+        if match and match.end() == len(self.text) and match.group(0) not in _LITERALS and any(
+            literal.startswith(match.group(0)) for literal in _LITERALS
+        ):
+            # 字面量只输出了一部分，如 "tru"
+            raise _Truncated()
+        if match and match.group(0) in _LITERALS:
+            self.pos = match.end()
+            return _LITERALS[match.group(0)]
+        if match or c == "(":
+            # function(...) {...}、箭头函数、new 表达式等无法转换为 JSON，整体跳过
+            self._skip_expression()
+            return _SKIP
+        raise self._error(f"无法识别的字符 {c!r}")
+
+    def _parse_object(self) -> Dict[str, Any]:
+        self.pos += 1
+        result = {}
+        while True:
+            self._skip_whitespace()
+            if self._at_end():
+                self.truncated = True
+                return result
+
+            c = self.text[self.pos]
+            if c == "}":
+                self.pos += 1
+                return result
+            if c == ",":
+                self.pos += 1
+                continue
+
+            try:
+                key = self._parse_key()
+                self._skip_whitespace()
+                if self._at_end():
+                    raise _Truncated()
+                if self.text[self.pos] != ":":
+                    raise self._error("对象的键后缺少冒号")
+                self.pos += 1
+                value = self._parse_value()
+            except _Truncated:
+                # 键或值不完整，丢弃这一项；其余输入都属于这一项，外层不再继续解析
+                self.truncated = True
+                self.pos = len(self.text)
+                return result
+
+            if value is not _SKIP:
+                result[key] = value
+
+    def _parse_key(self) -> str:
+        c = self.text[self.pos]
+        if c in "\"'`":
+            return self._parse_string()
+        match = _IDENTIFIER_PATTERN.match(self.text, self.pos) or _NUMBER_PATTERN.match(self.text, self.pos)
+        if not match:
+            raise self._error(f"无效的对象键 {c!r}")
+        self.pos = match.end()
+        if self._at_end():
+            raise _Truncated()
+        return match.group(0)
+
+    def _parse_array(self) -> List[Any]:
+        self.pos += 1
+        result = []
+        while True:
+            self._skip_whitespace()
+            if self._at_end():
+                self.truncated = True
+                return result
+
+            c = self.text[self.pos]
+            if c == "]":
+                self.pos += 1
+                return result
+            if c == ",":
+                self.pos += 1
+                continue
+
+            try:
+                value = self._parse_value()
+            except _Truncated:
+                self.truncated = True
+                self.pos = len(self.text)
+                return result
+            if value is not _SKIP:
+                result.append(value)
+
+    def _parse_string(self) -> str:
+        quote = self.text[self.pos]
+        self.pos += 1
+        chars = []
+        text = self.text
+        while self.pos < len(text):
+            c = text[self.pos]
+            if c == quote:
+                self.pos += 1
+                return "".join(chars)
+            if c == "\\" and self.pos + 1 < len(text):
+                escaped = text[self.pos + 1]
+                if escaped == "u" and self.pos + 6 <= len(text):
+                    try:
+                        chars.append(chr(int(text[self.pos + 2:self.pos + 6], 16)))
+                        self.pos += 6
+                        continue
+                    except ValueError:
+                        pass
+                chars.append({"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}.get(escaped, escaped))
+                self.pos += 2
+                continue
+            chars.append(c)
+            self.pos += 1
+        raise _Truncated()
+
+    def _parse_number(self) -> Any:
+        match = _NUMBER_PATTERN.match(self.text, self.pos)
+        if not match:
+            rest = self.text[self.pos:].rstrip()
+            body = rest.lstrip("+-")
+            if len(rest) - len(body) <= 1 and (body in ("", ".") or "Infinity".startswith(body)):
+                # 输出在符号或小数点之后结束，如 "[10,-"
+                raise _Truncated()
+            raise self._error("无效的数字")
+        self.pos = match.end()
+        if self._at_end() or _PARTIAL_NUMBER_TAIL.fullmatch(self.text, self.pos):
+            # 数字后面直接结束，或只输出了指数、十六进制前缀的一部分，如 "1e-"、"0x"
+            raise _Truncated()
+
+        literal = match.group(0)
+        if literal.lstrip("+-") == "Infinity":
+            return None
+        if literal.lstrip("+-").lower().startswith("0x"):
+            return int(literal, 16)
+        if re.fullmatch(r"[+-]?\d+", literal):
+            return int(literal)
+        return float(literal)
+
+    def _skip_expression(self) -> None:
+        """跳过一个表达式，直到同一层级的逗号或右括号"""
+        depth = 0
+        text = self.text
+        while self.pos < len(text):
+            c = text[self.pos]
+            if c in "\"'`":
+                try:
+                    self._parse_string()
+                except _Truncated:
+                    return
+                continue
+            if text.startswith("//", self.pos) or text.startswith("/*", self.pos):
+                self._skip_whitespace()
+                continue
+            if c in "([{":
+                depth += 1
+            elif c in ")]}":
+                if depth == 0:
+                    return
+                depth -= 1
+            elif c == "," and depth == 0:
+                return
+            self.pos += 1
+
+
+def _candidate_texts(text: str) -> List[Tuple[int, str]]:
+    """按优先级返回可能包含配置的文本片段及其在完整输出中的起始位置：代码块内容优先，其次是完整文本"""
+    candidates = [(match.start(1), match.group(1)) for match in _FENCE_PATTERN.finditer(text) if "{" in match.group(1)]
+    candidates.append((0, text))
+    return candidates
+
+
+def unwrap_code_fence(text: str) -> str:
+    """去掉模型输出外层的 Markdown 代码块标记，没有代码块时原样返回"""
+    match = _FENCE_PATTERN.search(text)
+    if match and not text[:match.start()].strip():
+        return match.group(1).rstrip()
+    return text
+
+
+def extract_json_object(text: str, require_echarts_keys: bool = True) -> Tuple[Dict[str, Any], bool]:
+    """
+    从模型输出中提取 JSON 对象
+
+    先对完整输出和代码块内容尝试标准 JSON 解析；失败时在文本中查找对象起始位置，按 JS 对象字面量
+    宽松解析，并补全被截断的结构。宽松解析默认只接受包含 ECharts 顶层字段的对象，外层对象解析失败时
+    不会退而返回其中的内层对象（如 title），以便调用方把错误发回模型修正。
+
+    Args:
+        text: 模型输出
+        require_echarts_keys: 宽松解析是否要求对象包含 ECharts 顶层字段，解析 Merge Patch 时应设为 False
+
+    Returns:
+        (解析出的对象, 输出是否被截断)
+
+    Raises:
+        JSONExtractError: 无法提取对象时抛出，消息中包含解析错误，pos 为最外层对象的出错位置
+    """
+    candidates = _candidate_texts(text)
+    for _, candidate in reversed(candidates):
+        try:
+            # NaN/Infinity 与宽松解析一致地转换为 null，保证结果能以 allow_nan=False 序列化
+            result = json.loads(candidate.strip(), parse_constant=lambda _: None)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(result, dict):
+            return result, False
+
+    # 报告优先级最高的候选中最外层对象的错误，内层对象的错误对修正没有帮助
+    error = None
+    for offset, candidate in candidates:
+        start = candidate.find("{")
+        while start != -1:
+            parser = _LenientParser(candidate, start)
+            try:
+                result = parser.parse()
+            except JSONExtractError as e:
+                error = error or JSONExtractError(e.message, offset + e.pos)
+                start = candidate.find("{", start + 1)
+                continue
+            except ValueError as e:
+                error = error or JSONExtractError(str(e))
+                start = candidate.find("{", start + 1)
+                continue
+            except _Truncated:
+                error = error or JSONExtractError("输出被截断")
+                start = candidate.find("{", start + 1)
+                continue
+
+            if isinstance(result, dict) and (not require_echarts_keys or ECHARTS_KEYS & result.keys()):
+                return result, parser.truncated
+            if isinstance(result, dict) and result:
+                error = error or JSONExtractError(
+                    f"输出中的对象不包含 ECharts 配置字段: {', '.join(list(result)[:5])}"
+                )
+            # 跳过已解析的对象，继续查找后续候选
+            start = candidate.find("{", max(parser.pos, start + 1))
+
+    raise error or JSONExtractError("输出中没有找到 JSON 对象")
@@ -0,0 +1,291 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Iterator, List
+
+from config import settings
+
+
+# 优先级类别，数值越小越先获得上游调用名额
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# 当前请求的优先级，由 HTTP/stdio 入口设置，DeepSeekClient 调用上游时读取
+current_priority: ContextVar[str] = ContextVar("llm_priority", default="interactive")
+
+
+@contextmanager
+def use_priority(priority: str) -> Iterator[None]:
+    """
+    在上下文中设置上游调用的优先级
+
+    Args:
+        priority: 优先级类别，interactive 或 batch
+
+    Raises:
+        ValueError: 未知的优先级
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}，可选值: {', '.join(PRIORITIES)}")
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class SchedulerOverloaded(Exception):
+    """排队期限内无法获得上游调用名额"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    """令牌桶：容量为每分钟额度，按秒匀速补充，允许因实际用量超出估计而短暂为负"""
+
+    def __init__(self, per_minute: Optional[int]):
+        self.capacity = float(per_minute) if per_minute else None
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.capacity is None:
+            return
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+
+    def cost(self, amount: float) -> float:
+        """单次请求最多按整个桶的容量计费，否则永远无法满足"""
+        return amount if self.capacity is None else min(amount, self.capacity)
+
+    def wait_time(self, amount: float) -> float:
+        """补充到 amount 所需的秒数"""
+        if self.capacity is None or self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        if self.capacity is not None:
+            self.level -= amount
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "admitted", "cancelled")
+
+    def __init__(self, priority: int, tokens: float):
+        self.priority = priority
+        self.tokens = tokens
+        self.admitted = False
+        self.cancelled = False
+
+
+class Ticket:
+    """一次已获准的上游调用，结束后用实际 token 用量修正令牌桶"""
+
+    def __init__(self, scheduler: "LLMScheduler", tokens: float):
+        self._scheduler = scheduler
+        self.tokens = tokens
+
+    def settle(self, actual_tokens: Optional[float]) -> None:
+        """
+        按实际用量修正预扣的 TPM 额度
+
+        Args:
+            actual_tokens: 响应 usage 中的 total_tokens，未知时保持预扣值
+        """
+        if actual_tokens is None:
+            return
+        with self._scheduler._condition:
+            self._scheduler._tpm.consume(actual_tokens - self.tokens)
+            self.tokens = actual_tokens
+
+
+class LLMScheduler:
+    """
+    上游模型调用的准入控制
+
+    限制全局并发数，按账号的 RPM/TPM 做令牌桶限流，按优先级排队（交互调用优先于批量任务）。
+    预计无法在排队期限内获得名额或该优先级的排队数达到上限时立即拒绝，由调用方返回 503 和重试时间，
+    避免请求堆积到超时，也避免排队的调用占满线程池。每个优先级有独立的排队上限，
+    批量任务排满时交互调用仍可排队。
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, rpm: Optional[int] = None,
+                 tpm: Optional[int] = None, max_queued: Optional[Dict[str, int]] = None):
+        """
+        初始化调度器
+
+        Args:
+            max_concurrency: 最大并发调用数，默认使用 settings.LLM_MAX_CONCURRENCY
+            rpm: 每分钟请求数上限，默认使用 settings.LLM_RPM_LIMIT，为空时不限制
+            tpm: 每分钟 token 数上限，默认使用 settings.LLM_TPM_LIMIT，为空时不限制
+            max_queued: 各优先级同时排队等待的调用数上限，默认使用 settings.LLM_MAX_QUEUED_INTERACTIVE
+                和 settings.LLM_MAX_QUEUED_BATCH
+        """
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.max_queued = max_queued or {
+            "interactive": settings.LLM_MAX_QUEUED_INTERACTIVE,
+            "batch": settings.LLM_MAX_QUEUED_BATCH
+        }
+        self._rpm = _TokenBucket(rpm if rpm is not None else settings.LLM_RPM_LIMIT)
+        self._tpm = _TokenBucket(tpm if tpm is not None else settings.LLM_TPM_LIMIT)
+        self._condition = threading.Condition()
+        self._queue: List[Any] = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._waiting: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self._paused_until = 0.0
+        # 单次调用耗时的滑动平均，用于预估排队时间
+        self._avg_duration = 5.0
+        self.admitted = 0
+        self.rejected = 0
+
+    @contextmanager
+    def admit(self, tokens: float, priority: Optional[str] = None) -> Iterator[Ticket]:
+        """
+        排队获取一次上游调用名额，退出上下文时释放
+
+        Args:
+            tokens: 预计消耗的 token 数（输入加 max_tokens）
+            priority: 优先级类别，默认取当前上下文的优先级
+
+        Returns:
+            Ticket，调用结束后可用实际用量调用 settle()
+
+        Raises:
+            SchedulerOverloaded: 排队期限内无法获得名额，或该优先级排队的调用数已达上限
+        """
+        priority = priority or current_priority.get()
+        timeout = (settings.LLM_QUEUE_TIMEOUT_BATCH if priority == "batch"
+                   else settings.LLM_QUEUE_TIMEOUT_INTERACTIVE)
+        tokens = self._tpm.cost(tokens)
+        waiter = _Waiter(PRIORITIES[priority], tokens)
+
+        with self._condition:
+            now = time.monotonic()
+            deadline = now + timeout
+            expected_wait = self._expected_wait(waiter, now)
+            if expected_wait > timeout:
+                self.rejected += 1
+                raise SchedulerOverloaded(
+                    f"上游模型调用繁忙，预计排队 {expected_wait:.1f} 秒，超过期限 {timeout} 秒", expected_wait
+                )
+
+            heapq.heappush(self._queue, (waiter.priority, next(self._sequence), waiter))
+            self._dispatch(now)
+            if not waiter.admitted and self._waiting[priority] >= self.max_queued[priority]:
+                # 排队的调用各占一个线程，排满后立即拒绝，避免线程池被等待者占满而饿死其他工具；
+                # 按优先级分别计数，批量任务排满不影响交互调用
+                waiter.cancelled = True
+                self.rejected += 1
+                retry_after = max(self._expected_wait(_Waiter(waiter.priority, tokens), now), 1.0)
+                raise SchedulerOverloaded(
+                    f"上游模型调用繁忙，已有 {self._waiting[priority]} 个 {priority} 调用在排队", retry_after
+                )
+
+            self._waiting[priority] += 1
+            try:
+                while not waiter.admitted:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        waiter.cancelled = True
+                        self.rejected += 1
+                        # 让出队首位置后，后面的请求可能已经可以放行
+                        self._dispatch(now)
+                        self._condition.notify_all()
+                        retry_after = max(self._expected_wait(_Waiter(waiter.priority, tokens), now), 1.0)
+                        raise SchedulerOverloaded(f"上游模型调用繁忙，排队超过 {timeout} 秒", retry_after)
+                    self._condition.wait(min(remaining, self._refill_wait(now) or remaining))
+                    now = time.monotonic()
+                    self._dispatch(now)
+            finally:
+                self._waiting[priority] -= 1
+
+        started_at = time.monotonic()
+        try:
+            yield Ticket(self, tokens)
+        finally:
+            duration = time.monotonic() - started_at
+            with self._condition:
+                self._active -= 1
+                self._avg_duration = self._avg_duration * 0.8 + duration * 0.2
+                self._dispatch(time.monotonic())
+                self._condition.notify_all()
+
+    def backoff(self, seconds: float) -> None:
+        """
+        上游返回 429 时暂停放行
+
+        Args:
+            seconds: 暂停时长，通常取响应头 Retry-After
+        """
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回当前并发、排队和准入统计"""
+        with self._condition:
+            queued: Dict[str, int] = {name: 0 for name in PRIORITIES}
+            names = {value: name for name, value in PRIORITIES.items()}
+            for priority, _, waiter in self._queue:
+                if not waiter.cancelled:
+                    queued[names[priority]] += 1
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "waiting": dict(self._waiting),
+                "max_queued": dict(self.max_queued),
+                "queued": queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_duration": round(self._avg_duration, 3)
+            }
+
+    def _dispatch(self, now: float) -> None:
+        """按优先级依次放行队首请求，直到并发或令牌不足（需持有锁）"""
+        self._rpm.refill(now)
+        self._tpm.refill(now)
+        while self._queue:
+            _, _, head = self._queue[0]
+            if head.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if (now < self._paused_until or self._active >= self.max_concurrency
+                    or self._rpm.wait_time(1) > 0 or self._tpm.wait_time(head.tokens) > 0):
+                return
+            heapq.heappop(self._queue)
+            self._rpm.consume(1)
+            self._tpm.consume(head.tokens)
+            self._active += 1
+            self.admitted += 1
+            head.admitted = True
+            self._condition.notify_all()
+
+    def _refill_wait(self, now: float) -> float:
+        """队首请求等到令牌补足或暂停结束所需的秒数，0 表示只需等待并发名额"""
+        if not self._queue:
+            return 0.0
+        head = self._queue[0][2]
+        return max(self._paused_until - now, self._rpm.wait_time(1), self._tpm.wait_time(head.tokens), 0.0)
+
+    def _expected_wait(self, waiter: _Waiter, now: float) -> float:
+        """估计新请求排在同级及更高优先级请求之后需要等待的秒数（需持有锁）"""
+        self._rpm.refill(now)
+        self._tpm.refill(now)
+        ahead = [w for p, _, w in self._queue if p <= waiter.priority and not w.cancelled]
+
+        # 并发名额：前面的请求和正在执行的请求分批完成
+        slots_needed = self._active + len(ahead) + 1 - self.max_concurrency
+        concurrency_wait = math.ceil(slots_needed / self.max_concurrency) * self._avg_duration if slots_needed > 0 else 0.0
+
+        # 令牌：前面的请求和自己的消耗都要先补足
+        rate_wait = max(
+            self._rpm.wait_time(len(ahead) + 1),
+            self._tpm.wait_time(sum(w.tokens for w in ahead) + waiter.tokens)
+        )
+        return max(concurrency_wait, rate_wait, self._paused_until - now)
@@ -0,0 +1,153 @@
+import json
+import math
+import re
+import threading
+from typing import Dict, Any, Optional
+
+from config import settings
+
+
+# 提示中表示复杂图表的关键词，每命中一个增加复杂度
+_COMPLEX_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"dual[- ]axis|second(ary)? y|two y|multi[- ]?axis|双轴|双 y 轴|次坐标|多坐标轴",
+    r"dashboard|subplot|multiple charts|grid of|仪表盘|多个图表|子图|联动",
+    r"stack|堆叠",
+    r"mark ?(line|point|area)|annotat|average line|trend ?line|标注|平均线|趋势线|参考线",
+    r"combin|mixed|overlay|组合|混合|叠加",
+    r"visual ?map|heat ?map|gradient|渐变|热力",
+    r"animation|timeline|动画|时间轴",
+    r"radar|sankey|treemap|sunburst|graph network|雷达|桑基|矩形树|旭日|关系图",
+)]
+
+
+class ModelRouter:
+    """根据数据规模和提示复杂度选择模型和 max_tokens，并根据实际 usage 调整估计"""
+
+    def __init__(self):
+        """初始化路由器"""
+        self._lock = threading.Lock()
+        # 实际输出 token 数与估计值之比，按模型分别记录，用于修正后续估计
+        self._ratios: Dict[str, float] = {}
+        self._observations: Dict[str, int] = {}
+
+    def plan(self, prompt: str, data: Optional[Dict[str, Any]] = None,
+             prompt_data: Optional[str] = None) -> Dict[str, Any]:
+        """
+        为一次配置生成选择模型和生成参数
+
+        Args:
+            prompt: 用户提示
+            data: 数据集
+            prompt_data: 提示中使用的数据 JSON，未提供时按 data 计算
+
+        Returns:
+            生成计划，包含 model、max_tokens、temperature、timeout、complexity、estimated_tokens，
+            以及未经修正系数缩放的 base_tokens 和为思维链预留的 reserved_tokens
+        """
+        if not settings.MODEL_ROUTING_ENABLED:
+            return {
+                "model": settings.DEEPSEEK_MODEL,
+                "max_tokens": 2048,
+                "temperature": 0.3,
+                "timeout": settings.DEEPSEEK_TIMEOUT,
+                "complexity": None,
+                "estimated_tokens": None,
+                "base_tokens": None,
+                "reserved_tokens": 0
+            }
+
+        if prompt_data is None:
+            prompt_data = json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else ""
+
+        series = data.get("series") if isinstance(data, dict) else None
+        series_count = len(series) if isinstance(series, list) else (1 if series else 0)
+
+        complexity = sum(1 for pattern in _COMPLEX_PATTERNS if pattern.search(prompt))
+        if series_count > 3:
+            complexity += 1
+        if len(prompt) > 300:
+            complexity += 1
+
+        # 模型通常会把数据原样写回配置，输出长度约为数据长度加上配置骨架
+        base_estimate = (
+            len(prompt_data) / settings.TOKEN_ESTIMATE_CHARS_PER_TOKEN
+            + settings.TOKEN_ESTIMATE_SKELETON
+            + settings.TOKEN_ESTIMATE_PER_SERIES * max(series_count, 1)
+            + settings.TOKEN_ESTIMATE_SKELETON * complexity
+        )
+
+        chat_estimate = base_estimate * self._ratio(settings.DEEPSEEK_MODEL)
+        use_reasoner = (complexity >= settings.MODEL_ROUTING_COMPLEXITY_THRESHOLD
+                        or chat_estimate * settings.TOKEN_ESTIMATE_SAFETY_FACTOR > settings.DEEPSEEK_CHAT_MAX_TOKENS)
+
+        if use_reasoner:
+            model = settings.DEEPSEEK_REASONER_MODEL
+            # 推理模型的 max_tokens 包含思维链，需要额外预留
+            reserved = settings.REASONER_THINKING_TOKENS
+            estimate = base_estimate * self._ratio(model) + reserved
+            limit = settings.DEEPSEEK_REASONER_MAX_TOKENS
+            timeout = settings.DEEPSEEK_REASONER_TIMEOUT
+        else:
+            model = settings.DEEPSEEK_MODEL
+            reserved = 0
+            estimate = chat_estimate
+            limit = settings.DEEPSEEK_CHAT_MAX_TOKENS
+            timeout = settings.DEEPSEEK_TIMEOUT
+
+        max_tokens = min(limit, max(settings.MIN_MAX_TOKENS,
+                                    int(math.ceil(estimate * settings.TOKEN_ESTIMATE_SAFETY_FACTOR))))
+        return {
+            "model": model,
+            "max_tokens": max_tokens,
+            # 简单图表使用较低温度以保持输出稳定
+            "temperature": 0.2 if complexity == 0 else 0.3,
+            "timeout": timeout,
+            "complexity": complexity,
+            "estimated_tokens": int(estimate),
+            "base_tokens": base_estimate,
+            "reserved_tokens": reserved
+        }
+
+    def observe(self, plan: Dict[str, Any], usage: Optional[Dict[str, Any]],
+                finish_reason: Optional[str] = None) -> None:
+        """
+        根据实际 usage 修正该模型的输出长度估计
+
+        Args:
+            plan: plan() 返回的生成计划
+            usage: 响应中的 usage 字段
+            finish_reason: 响应的结束原因，length 表示输出被截断
+        """
+        base = plan.get("base_tokens")
+        if not base or not usage or not usage.get("completion_tokens"):
+            return
+
+        model = plan["model"]
+        output = usage["completion_tokens"]
+        if plan.get("reserved_tokens"):
+            # 推理模型的 completion_tokens 包含思维链，只用正式输出修正系数
+            reasoning = (usage.get("completion_tokens_details") or {}).get("reasoning_tokens")
+            output -= reasoning if reasoning is not None else plan["reserved_tokens"]
+        # 与未缩放的基础估计比较，系数收敛到真实比例；与已缩放的估计比较会收敛到其平方根
+        observed = max(output, 1) / base
+        if finish_reason == "length":
+            # 被截断时实际需要的长度未知，按比例放大
+            observed *= 1.5
+
+        alpha = settings.TOKEN_ESTIMATE_LEARNING_RATE
+        with self._lock:
+            ratio = self._ratios.get(model, 1.0)
+            self._ratios[model] = min(4.0, max(0.25, ratio * (1 - alpha) + observed * alpha))
+            self._observations[model] = self._observations.get(model, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回各模型当前的估计修正系数"""
+        with self._lock:
+            return {
+                model: {"ratio": round(ratio, 3), "observations": self._observations.get(model, 0)}
+                for model, ratio in self._ratios.items()
+            }
+
+    def _ratio(self, model: str) -> float:
+        with self._lock:
+            return self._ratios.get(model, 1.0)
@@ -0,0 +1,349 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, FrozenSet
+
+
+# MinHash 参数：NUM_BANDS * ROWS_PER_BAND 个哈希函数，分段用于 LSH 候选检索
+NUM_BANDS = 16
+ROWS_PER_BAND = 6
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+
+_MAX_HASH = (1 << 32) - 1
+
+# 英文停用词，对图表意图没有影响
+_STOPWORDS = frozenset({
+    "a", "an", "the", "of", "by", "for", "with", "in", "on", "and", "to", "per",
+    "show", "me", "please", "make", "create", "generate", "draw", "plot", "give",
+    "i", "want", "need", "using", "use", "as", "from", "that", "this", "each", "every",
+})
+
+# 中文常见虚词和指令词
+_CJK_STOPWORDS = ("生成", "一个", "展示", "显示", "绘制", "创建", "请", "帮我", "的", "按", "每")
+
+_TOKEN_PATTERN = re.compile(r"[a-z]+|\d+(?:\.\d+)?|[一-鿿]+")
+
+# 决定图表类型和布局的词（归一化后的英文词干和中文双字），两个提示中出现的这些词必须完全一致
+_LAYOUT_TOKENS = frozenset({
+    "line", "bar", "column", "pie", "scatter", "bubble", "area", "radar", "heatmap", "funnel", "gauge",
+    "candlestick", "boxplot", "histogram", "treemap", "sunburst", "sankey", "graph", "map", "polar",
+    "donut", "doughnut", "ring", "rose", "nightingale", "horizontal", "vertical", "stack", "stacked",
+    "smooth", "smoothed", "step", "log", "logarithmic", "percent", "percentage", "normalized", "normalised",
+    "cumulative", "dual", "secondary", "grouped",
+    "折线", "曲线", "柱状", "柱形", "条形", "饼图", "饼状", "散点", "气泡", "面积", "雷达", "热力", "漏斗",
+    "仪表", "k线", "箱线", "直方", "矩形", "旭日", "桑基", "地图", "极坐", "环形", "圆环", "玫瑰", "南丁",
+    "横向", "纵向", "水平", "垂直", "堆叠", "平滑", "阶梯", "对数", "百分", "分比", "占比", "累计", "双轴", "分组",
+})
+
+
+def _stem(word: str) -> str:
+    """简单的英文词干化，只处理常见的复数和副词后缀"""
+    if len(word) > 4 and word.endswith("ly"):
+        word = word[:-2]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_prompt(prompt: str) -> FrozenSet[str]:
+    """
+    将提示词归一化为词集合
+
+    英文按单词切分并去除停用词、做简单词干化；中文去除虚词后按相邻两字切分。
+    使用集合表示，因此词序不同的同义提示会得到相同的结果。
+
+    Args:
+        prompt: 用户提示
+
+    Returns:
+        归一化后的词集合
+    """
+    tokens = set()
+    for token in _TOKEN_PATTERN.findall(prompt.lower()):
+        if token[0].isascii() and token[0].isalpha():
+            if token not in _STOPWORDS:
+                tokens.add(_stem(token))
+        elif token[0].isdigit():
+            tokens.add(token)
+        else:
+            for word in _CJK_STOPWORDS:
+                token = token.replace(word, " ")
+            for part in token.split():
+                if len(part) == 1:
+                    tokens.add(part)
+                for i in range(len(part) - 1):
+                    tokens.add(part[i:i + 2])
+    return frozenset(tokens)
+
+
+def minhash_signature(tokens: FrozenSet[str]) -> Tuple[int, ...]:
+    """
+    计算词集合的 MinHash 签名
+
+    Args:
+        tokens: 归一化后的词集合
+
+    Returns:
+        长度为 NUM_PERM 的签名
+    """
+    if not tokens:
+        return tuple([_MAX_HASH] * NUM_PERM)
+
+    # 每个词用 SHAKE-128 派生 NUM_PERM 个独立的 32 位哈希值，逐列取最小值
+    hashes = []
+    for token in tokens:
+        values = array("I")
+        values.frombytes(hashlib.shake_128(token.encode("utf-8")).digest(NUM_PERM * 4))
+        hashes.append(values)
+    return tuple(map(min, zip(*hashes)))
+
+
+def data_schema_key(data: Optional[Dict[str, Any]]) -> str:
+    """
+    计算数据结构的指纹，只描述字段和类型，不包含具体数值
+
+    Args:
+        data: 数据集
+
+    Returns:
+        数据结构指纹
+    """
+    def describe(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {k: describe(v) for k, v in sorted(value.items())}
+        if isinstance(value, list):
+            if value and all(isinstance(item, dict) for item in value):
+                # 对象列表（如 series）的结构和数量都会影响配置
+                return [describe(item) for item in value]
+            # 标量列表只记录元素类型，不记录长度
+            return ["list", sorted({type(item).__name__ for item in value})]
+        return type(value).__name__
+
+    return json.dumps(describe(data), sort_keys=True)
+
+
+def _bind_data(skeleton: Dict[str, Any], data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    将数据绑定到缓存的配置骨架中
+
+    只处理 xAxis 数据、series 的 name/data 以及饼图数据，
+    数据包含其他字段或骨架中存在无法定位的数据字段时返回 None。
+
+    Args:
+        skeleton: 配置骨架
+        data: 新数据
+
+    Returns:
+        绑定数据后的配置，无法绑定时返回 None
+    """
+    if data and set(data) - {"xAxis", "series", "data"}:
+        return None
+
+    config = copy.deepcopy(skeleton)
+    if not data:
+        return config
+
+    series_list = config.get("series")
+    if isinstance(series_list, dict):
+        series_list = [series_list]
+    if not isinstance(series_list, list):
+        return None
+
+    if "xAxis" in data:
+        x_axis = config.get("xAxis")
+        if isinstance(x_axis, list):
+            x_axis = x_axis[0] if x_axis else None
+        if not isinstance(x_axis, dict) or "data" not in x_axis:
+            return None
+        x_axis["data"] = data["xAxis"]
+
+    if "series" in data:
+        data_series = data["series"]
+        if isinstance(data_series, dict):
+            data_series = [data_series]
+        if len(data_series) > len(series_list):
+            return None
+        for target, source in zip(series_list, data_series):
+            if not isinstance(target, dict) or "data" not in source:
+                return None
+            target["data"] = source["data"]
+            if "name" in source:
+                target["name"] = source["name"]
+    elif "data" in data:
+        if not series_list or not isinstance(series_list[0], dict):
+            return None
+        series_list[0]["data"] = data["data"]
+
+    return config
+
+
+def _without_values(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """生成与数据结构相同但数值为空的占位数据，用于从配置中剥离数据得到骨架"""
+    if not data:
+        return data
+    empty = {}
+    if "xAxis" in data:
+        empty["xAxis"] = []
+    if "series" in data:
+        series = data["series"]
+        if isinstance(series, dict):
+            series = [series]
+        empty["series"] = [{**item, "data": []} for item in series]
+    if "data" in data:
+        empty["data"] = []
+    return empty
+
+
+class PromptCache:
+    """基于 MinHash/LSH 的近似提示词缓存，同一数据结构下相似的提示复用已生成的配置骨架"""
+
+    def __init__(self, threshold: float = 0.8, max_entries: int = 1000):
+        """
+        初始化缓存
+
+        Args:
+            threshold: 相似度阈值（不同的词按两倍计入的 Jaccard），达到阈值才复用
+            max_entries: 最大缓存条目数，超出后按最近最少使用淘汰
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, prompt: str, data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        查找相似提示的缓存配置，并绑定新数据
+
+        Args:
+            prompt: 用户提示
+            data: 数据集
+
+        Returns:
+            绑定新数据后的配置，未命中时返回 None
+        """
+        tokens = normalize_prompt(prompt)
+        schema_key = data_schema_key(data)
+        signature = minhash_signature(tokens)
+
+        with self._lock:
+            best_entry = None
+            best_score = 0.0
+            for entry_id in self._candidates(schema_key, signature):
+                score = self._similarity(tokens, self._entries[entry_id]["tokens"])
+                if score > best_score:
+                    best_entry, best_score = entry_id, score
+
+            if best_entry is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_entry)
+            skeleton = self._entries[best_entry]["config"]
+            self.hits += 1
+
+        return _bind_data(skeleton, data)
+
+    def put(self, prompt: str, data: Optional[Dict[str, Any]], config: Dict[str, Any]) -> bool:
+        """
+        缓存生成的配置
+
+        只有当配置中的数据字段能够被重新绑定时才会缓存，避免复用时残留旧数据。
+
+        Args:
+            prompt: 用户提示
+            data: 数据集
+            config: 生成的配置
+
+        Returns:
+            是否已缓存
+        """
+        if not isinstance(config, dict) or _bind_data(config, data) != config:
+            return False
+        skeleton = _bind_data(config, _without_values(data))
+
+        tokens = normalize_prompt(prompt)
+        schema_key = data_schema_key(data)
+        signature = minhash_signature(tokens)
+        bands = self._bands(schema_key, signature)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "tokens": tokens,
+                "bands": bands,
+                "config": skeleton
+            }
+            for band in bands:
+                self._buckets.setdefault(band, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                old_id, old_entry = self._entries.popitem(last=False)
+                for band in old_entry["bands"]:
+                    bucket = self._buckets.get(band)
+                    if bucket is not None:
+                        bucket.discard(old_id)
+                        if not bucket:
+                            del self._buckets[band]
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "threshold": self.threshold
+            }
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def _candidates(self, schema_key: str, signature: Tuple[int, ...]) -> set:
+        """通过 LSH 分段检索候选条目"""
+        candidates = set()
+        for band in self._bands(schema_key, signature):
+            candidates.update(self._buckets.get(band, ()))
+        return candidates
+
+    @staticmethod
+    def _bands(schema_key: str, signature: Tuple[int, ...]) -> List[Tuple[str, int, Tuple[int, ...]]]:
+        """将签名按数据结构分段，作为 LSH 桶的键"""
+        return [
+            (schema_key, i, signature[i * ROWS_PER_BAND:(i + 1) * ROWS_PER_BAND])
+            for i in range(NUM_BANDS)
+        ]
+
+    @staticmethod
+    def _similarity(tokens: FrozenSet[str], other: FrozenSet[str]) -> float:
+        """
+        计算两个词集合的相似度
+
+        数字（如 top 5 与 top 10）以及图表类型、布局词（如 line 与 bar、horizontal）必须完全一致，
+        否则视为不相似。其余不同的词按两倍计入分母：只差一个附加词的提示仍可命中，
+        而替换了筛选条件（如 east region 与 west region）的提示会低于阈值。
+        """
+        if {t for t in tokens if t[0].isdigit()} != {t for t in other if t[0].isdigit()}:
+            return 0.0
+        if tokens & _LAYOUT_TOKENS != other & _LAYOUT_TOKENS:
+            return 0.0
+        union = tokens | other
+        if not union:
+            return 1.0
+        return len(tokens & other) / (len(union) + len(tokens ^ other))
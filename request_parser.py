@@ -0,0 +1,371 @@
+import asyncio
+import json
+import re
+from typing import Any, Optional, List, Tuple, AsyncIterator
+
+from config import settings
+
+
+# 结构和标量的字节级模式：UTF-8 多字节字符不含 ASCII 字节，直接在字节上匹配是安全的
+_WS = re.compile(rb"[ \t\r\n]*")
+_STRING_BODY = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*')
+_SCALAR = rb'(?:"[^"\\]*(?:\\.[^"\\]*)*"|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)'
+_NUMBER = re.compile(rb"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_LITERALS = {b"true": True, b"false": False, b"null": None}
+
+# 数组中连续的叶子元素（标量、只含标量的对象或数组），整段交给 C 实现的 json.loads 解码
+_LEAF = (
+    rb"(?:" + _SCALAR
+    + rb"|\{\s*(?:" + _SCALAR + rb"\s*:\s*" + _SCALAR + rb"\s*(?:,\s*" + _SCALAR + rb"\s*:\s*" + _SCALAR + rb"\s*)*)?\}"
+    + rb"|\[\s*(?:" + _SCALAR + rb"\s*(?:,\s*" + _SCALAR + rb"\s*)*)?\])"
+)
+# 末尾的前瞻保证最后一个元素完整（后面已经出现逗号或右括号）
+_LEAF_RUN = re.compile(_LEAF + rb"(?:\s*,\s*" + _LEAF + rb")*(?=\s*[,\]])")
+
+_DECODER = json.JSONDecoder()
+
+# 批量解码时查找切分逗号的最大尝试次数
+_MAX_CUT_ATTEMPTS = 8
+
+
+def _element_kind(first: bytes) -> bytes:
+    """按首字节区分数组元素的种类：对象、数组、字符串或其他标量"""
+    return first if first in (b"{", b"[", b'"') else b"0"
+
+
+# 解析状态
+_VALUE, _KEY, _COLON, _AFTER_VALUE = range(4)
+
+
+class RequestTooLarge(ValueError):
+    """请求体或单个参数超过字节数上限"""
+
+
+class _Frame:
+    """解析栈中的一个容器"""
+    __slots__ = ("container", "is_object", "key", "state")
+
+    def __init__(self, container: Any, is_object: bool):
+        self.container = container
+        self.is_object = is_object
+        self.key: Optional[str] = None
+        self.state = _KEY if is_object else _VALUE
+
+
+class StreamingJSONParser:
+    """
+    增量 JSON 解析器
+
+    按块接收请求体字节，已解析的部分立即释放，不保留完整的原始请求体。数组中连续的标量、
+    [x, y] 点和 {"name": ..., "value": ...} 这类扁平记录整段交给 json.loads 解码，
+    大型 data 数组直接生成 DataProcessor 使用的列表，速度接近一次性解析。解析结果仍是完整的对象树，
+    数组不会按列流式写入 DataProcessor 或类型化数组。
+
+    同时限制请求总字节数和 field_path 指定位置上每个值的字节数，超出时在读完请求之前就抛出异常。
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, max_field_bytes: Optional[int] = None,
+                 field_path: Tuple[Optional[str], ...] = ("tools", None, "parameters")):
+        """
+        初始化解析器
+
+        Args:
+            max_bytes: 请求体字节数上限，默认使用 settings.MAX_REQUEST_BYTES
+            max_field_bytes: 单个字段的字节数上限，默认使用 settings.MAX_FIELD_BYTES
+            field_path: 受字段上限约束的值所在对象的路径，None 匹配任意数组下标
+        """
+        self.max_bytes = max_bytes or settings.MAX_REQUEST_BYTES
+        self.max_field_bytes = max_field_bytes or settings.MAX_FIELD_BYTES
+        self.field_path = field_path
+        self._buf = b""
+        self._pos = 0
+        # 缓冲区起始位置在整个请求体中的偏移
+        self._offset = 0
+        self._stack: List[_Frame] = []
+        self._root: Any = None
+        self._done = False
+        # 当前正在解析的受限字段名称及其起始偏移
+        self._field: Optional[str] = None
+        self._field_start = 0
+        # 未结束的字符串从这里继续查找结束引号，避免大字符串被重复扫描
+        self._string_start: Optional[int] = None
+        self._string_resume = 0
+
+    @property
+    def bytes_received(self) -> int:
+        return self._offset + len(self._buf)
+
+    def feed(self, chunk: bytes) -> None:
+        """
+        输入一块请求体并尽可能向前解析
+
+        Args:
+            chunk: 请求体字节
+
+        Raises:
+            RequestTooLarge: 超过请求或字段字节数上限
+            ValueError: JSON 格式错误
+        """
+        if self.bytes_received + len(chunk) > self.max_bytes:
+            raise RequestTooLarge(f"请求体超过 {self.max_bytes} 字节上限")
+        # 丢弃已解析的部分
+        self._buf = self._buf[self._pos:] + chunk
+        self._offset += self._pos
+        if self._string_start is not None:
+            self._string_start -= self._pos
+            self._string_resume -= self._pos
+        self._pos = 0
+        self._parse(final=False)
+        self._check_field()
+
+    def close(self) -> Any:
+        """
+        结束输入并返回解析结果
+
+        Returns:
+            解析出的对象
+
+        Raises:
+            ValueError: 请求体不完整或有多余内容
+        """
+        self._parse(final=True)
+        self._pos = _WS.match(self._buf, self._pos).end()
+        if not self._done:
+            raise ValueError("请求体 JSON 不完整")
+        if self._pos < len(self._buf):
+            raise self._error("JSON 之后存在多余内容")
+        return self._root
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f"请求体 JSON 解析失败: {message} (位置 {self._offset + self._pos})")
+
+    def _check_field(self) -> None:
+        """检查正在解析的字段是否超过字节数上限"""
+        if self._field is not None and self._offset + self._pos - self._field_start > self.max_field_bytes:
+            raise RequestTooLarge(f"参数 {self._field} 超过 {self.max_field_bytes} 字节上限")
+        if self._string_start is not None and self._field is not None:
+            if self._offset + self._string_resume - self._field_start > self.max_field_bytes:
+                raise RequestTooLarge(f"参数 {self._field} 超过 {self.max_field_bytes} 字节上限")
+
+    def _at_field_level(self) -> bool:
+        """当前栈顶对象是否位于 field_path，即它的成员是受限字段"""
+        path = self.field_path
+        if len(self._stack) != len(path) + 1 or not self._stack[-1].is_object:
+            return False
+        for frame, expected in zip(self._stack, path):
+            if expected is not None and frame.key != expected:
+                return False
+        return True
+
+    def _parse(self, final: bool) -> None:
+        buf = self._buf
+        end = len(buf)
+        while not self._done:
+            self._pos = _WS.match(buf, self._pos).end()
+            if self._pos >= end:
+                return
+            frame = self._stack[-1] if self._stack else None
+            c = buf[self._pos:self._pos + 1]
+
+            if frame is not None and frame.state == _AFTER_VALUE:
+                if c == b",":
+                    self._pos += 1
+                    frame.state = _KEY if frame.is_object else _VALUE
+                elif c == (b"}" if frame.is_object else b"]"):
+                    self._pos += 1
+                    self._stack.pop()
+                    self._emit(frame.container)
+                else:
+                    raise self._error("缺少逗号或右括号")
+                continue
+
+            if frame is not None and frame.state == _KEY:
+                if c == b"}" and not frame.container:
+                    self._pos += 1
+                    self._stack.pop()
+                    self._emit(frame.container)
+                    continue
+                if c != b'"':
+                    raise self._error("对象的键必须是字符串")
+                key = self._read_string(final)
+                if key is None:
+                    return
+                frame.key = key
+                frame.state = _COLON
+                continue
+
+            if frame is not None and frame.state == _COLON:
+                if c != b":":
+                    raise self._error("对象的键后缺少冒号")
+                self._pos += 1
+                frame.state = _VALUE
+                if self._at_field_level():
+                    self._field = frame.key
+                    self._field_start = self._offset + self._pos
+                continue
+
+            # 值：数组中优先批量读取连续的叶子元素
+            if frame is not None and not frame.is_object and c != b"]" and self._read_elements(frame):
+                continue
+            if c == b"{":
+                self._pos += 1
+                self._stack.append(_Frame({}, True))
+            elif c == b"[":
+                self._pos += 1
+                self._stack.append(_Frame([], False))
+            elif c == b"]" and frame is not None and not frame.is_object and not frame.container:
+                self._pos += 1
+                self._stack.pop()
+                self._emit(frame.container)
+            elif c == b'"':
+                value = self._read_string(final)
+                if value is None:
+                    return
+                self._emit(value)
+            else:
+                match = _NUMBER.match(buf, self._pos)
+                if match:
+                    if not final and (match.end() >= end or buf[match.end():match.end() + 1] in (b".", b"e", b"E", b"+", b"-")):
+                        # 数字可能还没有输入完
+                        return
+                    self._pos = match.end()
+                    text = match.group(0)
+                    self._emit(float(text) if any(ch in text for ch in b".eE") else int(text))
+                    continue
+                if c == b"-" and self._pos + 1 >= end and not final:
+                    return
+                word = buf[self._pos:self._pos + 5]
+                for literal, value in _LITERALS.items():
+                    if word.startswith(literal):
+                        self._pos += len(literal)
+                        self._emit(value)
+                        break
+                else:
+                    if not final and len(word) < 5 and any(literal.startswith(word) for literal in _LITERALS):
+                        return
+                    raise self._error(f"无法识别的字符 {c!r}")
+
+    def _read_elements(self, frame: _Frame) -> bool:
+        """在数组中批量解码连续的完整元素，返回是否读到了元素"""
+        buf = self._buf
+        pos = self._pos
+        kind = _element_kind(buf[pos:pos + 1])
+        cut = len(buf)
+        # 在缓冲区末尾附近找一个元素之间的逗号（逗号后面是与首个元素同类的开头），
+        # 逗号之前的部分整段交给 json.loads；数组在缓冲区内结束时按 Extra data 的位置截取
+        for _ in range(_MAX_CUT_ATTEMPTS):
+            cut = buf.rfind(b",", pos, cut)
+            if cut <= pos:
+                break
+            after = _WS.match(buf, cut + 1).end()
+            if after < len(buf) and _element_kind(buf[after:after + 1]) != kind:
+                continue
+            try:
+                text = buf[pos:cut].decode("utf-8")
+            except UnicodeDecodeError:
+                raise self._error("请求体不是有效的 UTF-8")
+            try:
+                items, close = _DECODER.raw_decode("[" + text + "]")
+            except json.JSONDecodeError:
+                continue
+            if close == len(text) + 2:
+                end = cut
+            else:
+                # 数组在缓冲区内已经闭合，停在右括号上
+                end = pos + len(text[:close - 2].encode("utf-8"))
+            frame.container.extend(items)
+            self._pos = end
+            self._string_start = None
+            frame.state = _AFTER_VALUE
+            self._check_field()
+            return True
+
+        # 找不到合适的切分位置时，按模式匹配连续的叶子元素
+        match = _LEAF_RUN.match(buf, pos)
+        if not match:
+            return False
+        try:
+            frame.container.extend(json.loads(b"[" + match.group(0) + b"]"))
+        except json.JSONDecodeError as e:
+            raise self._error(e.msg)
+        self._pos = match.end()
+        self._string_start = None
+        frame.state = _AFTER_VALUE
+        self._check_field()
+        return True
+
+    def _read_string(self, final: bool) -> Optional[str]:
+        """读取一个完整的字符串，输入不足时返回 None 并记录扫描进度"""
+        if self._string_start != self._pos:
+            self._string_start = self._pos
+            self._string_resume = self._pos + 1
+        match = _STRING_BODY.match(self._buf, self._string_resume)
+        close = match.end()
+        if close >= len(self._buf) or self._buf[close:close + 1] != b'"':
+            if final:
+                raise self._error("字符串没有结束")
+            # 停在末尾的反斜杠之前，下次从这里继续
+            self._string_resume = close
+            self._check_field()
+            return None
+        try:
+            value = json.loads(self._buf[self._string_start:close + 1])
+        except json.JSONDecodeError as e:
+            raise self._error(e.msg)
+        self._pos = close + 1
+        self._string_start = None
+        return value
+
+    def _emit(self, value: Any) -> None:
+        """把解析完成的值放入父容器"""
+        if not self._stack:
+            self._root = value
+            self._done = True
+            return
+        frame = self._stack[-1]
+        if frame.is_object:
+            frame.container[frame.key] = value
+            if self._field is not None and self._at_field_level():
+                self._check_field()
+                self._field = None
+        else:
+            frame.container.append(value)
+        frame.state = _AFTER_VALUE
+
+
+async def parse_request_body(chunks: AsyncIterator[bytes], content_length: Optional[int] = None,
+                             parser: Optional[StreamingJSONParser] = None) -> Any:
+    """
+    增量解析请求体
+
+    Content-Length 超过上限时直接拒绝，不读取请求体；分块传输时边读边计数。
+
+    Args:
+        chunks: 请求体字节流，例如 Request.stream()
+        content_length: 请求头中的 Content-Length
+        parser: 解析器，默认使用配置中的上限
+
+    Returns:
+        解析出的对象
+
+    Raises:
+        RequestTooLarge: 超过请求或字段字节数上限
+        ValueError: JSON 格式错误
+    """
+    parser = parser or StreamingJSONParser()
+    if content_length is not None and content_length > parser.max_bytes:
+        raise RequestTooLarge(f"请求体超过 {parser.max_bytes} 字节上限")
+
+    # 小块先合并再解析，减少逐块调用的开销
+    pending: List[bytes] = []
+    pending_size = 0
+    async for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= settings.REQUEST_PARSE_CHUNK_BYTES:
+            # 解析在线程中进行，避免阻塞事件循环
+            await asyncio.to_thread(parser.feed, b"".join(pending))
+            pending, pending_size = [], 0
+    if pending:
+        await asyncio.to_thread(parser.feed, b"".join(pending))
+    return parser.close()
@@ -1,19 +1,73 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+import asyncio
 import json
-from typing import Dict, Any, List, Optional
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Literal, Union, Type, Callable
 
 from config import settings
 from deepseek_client import DeepSeekClient
 from echarts_utils import EChartsUtils
 from data_processor import DataProcessor
+from batch_processor import BatchProcessor
+from intent_router import IntentRouter
+from compression import CompressionMiddleware, CompressionCache
+from llm_scheduler import PRIORITIES, SchedulerOverloaded, use_priority
+from request_parser import RequestTooLarge, parse_request_body
+from chart_session import ChartSessionStore, strip_data, resolve_data_refs, apply_merge_patch
+from data_worker import DataWorkerPool, current_cancel_event
+
+# 延迟初始化的 DeepSeek 客户端
+_deepseek_client: Optional[DeepSeekClient] = None
+_deepseek_client_lock = threading.Lock()
+
+def get_deepseek_client() -> DeepSeekClient:
+    """获取 DeepSeek 客户端，首次调用时才创建"""
+    global _deepseek_client
+    if _deepseek_client is None:
+        with _deepseek_client_lock:
+            if _deepseek_client is None:
+                _deepseek_client = DeepSeekClient()
+    return _deepseek_client
+
+# 规则路由：简单提示直接本地生成配置
+intent_router = IntentRouter()
+
+# refine_chart 的图表会话
+chart_sessions = ChartSessionStore()
+
+# 重量级数据解析的常驻进程池
+data_workers = DataWorkerPool()
+
+def prewarm() -> None:
+    """预加载重量级依赖，使首次工具调用不再承担导入开销"""
+    import pandas  # noqa: F401
+    import requests  # noqa: F401
+    get_deepseek_client()
+    if settings.DATA_WORKER_ENABLED:
+        data_workers.start()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：按配置在后台线程中预热"""
+    if settings.PREWARM:
+        threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+    yield
+    data_workers.shutdown()
 
 # 创建 FastAPI 应用
 app = FastAPI(
     title="DeepSeek-ECharts MCP Server",
     description="DeepSeek 大模型与 ECharts 集成的 MCP Server",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置 CORS
@@ -25,8 +79,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化客户端和工具
-deepseek_client = DeepSeekClient()
+# 配置响应压缩，内容相同的响应只压缩一次
+compression_cache = CompressionCache()
+app.add_middleware(CompressionMiddleware, cache=compression_cache)
 
 # 请求和响应模型
 class ToolCall(BaseModel):
@@ -45,200 +100,225 @@ class MCPResponse(BaseModel):
     tool_responses: List[ToolResponse]
     status: str
 
-# 工具注册
-TOOLS = {
-    "generate_echarts_config": {
-        "description": "使用 DeepSeek 生成 ECharts 配置",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "prompt": {
-                    "type": "string",
-                    "description": "用户提示，描述需要的图表"
-                },
-                "data": {
-                    "type": "object",
-                    "description": "可选的数据集"
-                }
-            },
-            "required": ["prompt"]
-        }
-    },
-    "create_chart": {
-        "description": "创建指定类型的图表",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "chart_type": {
-                    "type": "string",
-                    "description": "图表类型: line, bar, pie, scatter"
-                },
-                "data": {
-                    "type": "object",
-                    "description": "数据集"
-                },
-                "title": {
-                    "type": "string",
-                    "description": "图表标题"
-                },
-                "theme": {
-                    "type": "string",
-                    "description": "主题: light, dark"
-                }
-            },
-            "required": ["chart_type"]
-        }
-    },
-    "process_data": {
-        "description": "处理和转换数据",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "data": {
-                    "type": "object",
-                    "description": "原始数据"
-                },
-                "data_type": {
-                    "type": "string",
-                    "description": "数据类型: json, csv, excel, dict"
-                },
-                "chart_type": {
-                    "type": "string",
-                    "description": "目标图表类型"
-                }
-            },
-            "required": ["data"]
-        }
-    },
-    "optimize_chart": {
-        "description": "优化图表配置",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "config": {
-                    "type": "object",
-                    "description": "原始图表配置"
-                }
-            },
-            "required": ["config"]
-        }
-    },
-    "generate_html": {
-        "description": "生成包含图表的 HTML",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "config": {
-                    "type": "object",
-                    "description": "图表配置"
-                },
-                "height": {
-                    "type": "string",
-                    "description": "图表高度"
-                }
-            },
-            "required": ["config"]
-        }
-    },
-    "create_and_open_chart": {
-        "description": "创建图表并在浏览器中打开",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "chart_type": {
-                    "type": "string",
-                    "description": "图表类型: line, bar, pie, scatter"
-                },
-                "data": {
-                    "type": "object",
-                    "description": "数据集"
-                },
-                "title": {
-                    "type": "string",
-                    "description": "图表标题"
-                },
-                "theme": {
-                    "type": "string",
-                    "description": "主题: light, dark"
-                },
-                "height": {
-                    "type": "string",
-                    "description": "图表高度"
-                }
-            },
-            "required": ["chart_type"]
-        }
-    },
-    "open_chart": {
-        "description": "在浏览器中打开现有图表配置",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "config": {
-                    "type": "object",
-                    "description": "图表配置"
-                },
-                "height": {
-                    "type": "string",
-                    "description": "图表高度"
-                }
-            },
-            "required": ["config"]
-        }
-    }
-}
+class BatchRequest(BaseModel):
+    jobs: List[Dict[str, Any]]
+    output_dir: Optional[str] = None
+    max_workers: Optional[int] = Field(None, ge=1)
+    chunk_size: Optional[int] = Field(None, ge=1)
+
+# 工具参数模型：每个工具只在这里声明一次参数，校验器在类定义时编译，/tools 的 JSON Schema 也由此生成
+ChartType = Literal["line", "bar", "pie", "scatter"]
+
+class GenerateEchartsConfigParams(BaseModel):
+    prompt: str = Field(description="用户提示，描述需要的图表")
+    data: Optional[Dict[str, Any]] = Field(None, description="可选的数据集")
+
+class CreateChartParams(BaseModel):
+    chart_type: ChartType = Field(description="图表类型: line, bar, pie, scatter")
+    data: Optional[Dict[str, Any]] = Field(None, description="数据集")
+    title: str = Field("", description="图表标题")
+    theme: str = Field("light", description="主题: light, dark")
+    data_format: Optional[Literal["series", "dataset"]] = Field(
+        None, description="数据输出格式: series（写入每个 series）或 dataset（共享列式 dataset.source）"
+    )
+    significant_digits: Optional[int] = Field(None, ge=1, le=17, description="数值保留的有效数字位数")
+    precision: Optional[Dict[str, int]] = Field(None, description="按 series 名称指定的小数位数")
+
+class ProcessDataParams(BaseModel):
+    data: Union[Dict[str, Any], str] = Field(description="原始数据")
+    data_type: Optional[Literal["json", "csv", "excel", "dict"]] = Field(
+        None, description="数据类型: json, csv, excel, dict"
+    )
+    chart_type: Optional[str] = Field(None, description="目标图表类型")
+    top_n: Optional[int] = Field(
+        None, ge=2, description="饼图保留的最大扇区数，其余合并为“其他”；为空时使用服务器配置 PIE_MAX_SLICES（默认不合并）"
+    )
+    sort: Optional[Literal["desc", "asc"]] = Field(None, description="饼图扇区按数值排序: desc, asc")
+    merge_duplicates: bool = Field(False, description="饼图是否合并同名扇区")
+    other_label: str = Field("其他", description="合并剩余扇区使用的名称")
+    reduction: Optional[Literal["bin", "sample"]] = Field(
+        None, description="散点图数据缩减方式: bin（网格分箱）, sample（分层采样，保留离群点）"
+    )
+    bin_shape: Literal["square", "hex"] = Field("square", description="分箱网格形状: square, hex")
+    bin_output: Literal["bubble", "heatmap"] = Field(
+        "bubble", description="分箱结果按数量映射为气泡大小（bubble）或颜色（heatmap）"
+    )
+    grid_size: Optional[int] = Field(
+        None, ge=2, le=1000, description="每个坐标轴上的格子数，默认使用服务器配置 SCATTER_GRID_SIZE"
+    )
+    sample_size: Optional[int] = Field(
+        None, ge=1, description="分层采样保留的点数，默认使用服务器配置 SCATTER_SAMPLE_SIZE"
+    )
+
+class OptimizeChartParams(BaseModel):
+    config: Dict[str, Any] = Field(description="原始图表配置")
+    profile: Optional[Dict[str, Any]] = Field(
+        None, description="process_data 返回的数据概况，提供时不再扫描配置中的数据"
+    )
+
+class GenerateHtmlParams(BaseModel):
+    config: Dict[str, Any] = Field(description="图表配置")
+    height: str = Field("400px", description="图表高度")
+    significant_digits: Optional[int] = Field(None, ge=1, le=17, description="数值保留的有效数字位数")
+
+class GenerateDashboardParams(BaseModel):
+    configs: List[Dict[str, Any]] = Field(min_length=1, description="图表配置列表")
+    title: str = Field("ECharts 仪表板", description="页面标题")
+    height: str = Field("400px", description="每个图表的高度")
+    columns: int = Field(1, ge=1, le=6, description="每行的图表数")
+    significant_digits: Optional[int] = Field(
+        None, ge=1, le=17, description="可选，嵌入页面前数值保留的有效数字位数"
+    )
+
+class RefineChartParams(BaseModel):
+    instruction: str = Field(description="修改要求，例如“改为横向柱状图”“添加第二个 y 轴”")
+    session_id: Optional[str] = Field(None, description="图表会话 ID，为空时用 config 新建会话")
+    config: Optional[Dict[str, Any]] = Field(None, description="新建会话时的初始图表配置")
+    version: Optional[int] = Field(None, ge=0, description="在指定版本的基础上修改，默认为最新版本")
+
+class CreateAndOpenChartParams(CreateChartParams):
+    height: str = Field("400px", description="图表高度")
+
+class OpenChartParams(BaseModel):
+    config: Dict[str, Any] = Field(description="图表配置")
+    height: str = Field("400px", description="图表高度")
 
 # 工具实现函数
 def generate_echarts_config(prompt: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """使用 DeepSeek 生成 ECharts 配置"""
+    """使用 DeepSeek 生成 ECharts 配置，简单提示由本地规则直接生成"""
     try:
-        config = deepseek_client.generate_echarts_config(prompt, data)
-        return {"config": config, "status": "success"}
+        started_at = time.perf_counter()
+        intent = intent_router.route(prompt, data) if settings.INTENT_ROUTER_ENABLED else None
+        if intent is not None:
+            config = EChartsUtils.create_chart_config(
+                intent["chart_type"], intent["data"], intent["title"], intent["theme"]
+            )
+            config = EChartsUtils.optimize_config(config)
+            route = "rules"
+            details = {}
+        else:
+            details = get_deepseek_client().generate_echarts_config_with_usage(prompt, data)
+            config = details.pop("config")
+            route = "deepseek"
+        intent_router.record(route, time.perf_counter() - started_at)
+        return {"config": config, "status": "success", "route": route, **details}
+    except SchedulerOverloaded:
+        # 交给传输层返回 503 和重试时间
+        raise
     except Exception as e:
         return {"error": str(e), "status": "error"}
 
 def create_chart(chart_type: str, data: Optional[Dict[str, Any]] = None, 
-                 title: str = "", theme: str = "light") -> Dict[str, Any]:
+                 title: str = "", theme: str = "light", data_format: Optional[str] = None,
+                 significant_digits: Optional[int] = None,
+                 precision: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
     """创建指定类型的图表"""
     try:
-        config = EChartsUtils.create_chart_config(chart_type, data, title, theme)
+        config = EChartsUtils.create_chart_config(
+            chart_type, data, title, theme, data_format, significant_digits, precision
+        )
         return {"config": config, "status": "success"}
     except Exception as e:
         return {"error": str(e), "status": "error"}
 
 def process_data(data: Dict[str, Any], data_type: Optional[str] = None, 
-                 chart_type: Optional[str] = None) -> Dict[str, Any]:
-    """处理和转换数据"""
+                 chart_type: Optional[str] = None, top_n: Optional[int] = None,
+                 sort: Optional[str] = None, merge_duplicates: bool = False,
+                 other_label: str = "其他", reduction: Optional[str] = None,
+                 bin_shape: str = "square", bin_output: str = "bubble",
+                 grid_size: Optional[int] = None, sample_size: Optional[int] = None) -> Dict[str, Any]:
+    """处理和转换数据，较大的数据在常驻工作进程中解析"""
     try:
-        processed_data = DataProcessor.process_data(data, data_type)
-        if chart_type:
-            processed_data = DataProcessor.format_for_echarts(processed_data, chart_type)
-        return {"data": processed_data, "status": "success"}
+        result = data_workers.process(
+            data, data_type, chart_type, top_n=top_n, sort=sort, merge_duplicates=merge_duplicates,
+            other_label=other_label, reduction=reduction, bin_shape=bin_shape, bin_output=bin_output,
+            grid_size=grid_size, sample_size=sample_size
+        )
+        return {"data": result["data"], "profile": result["profile"], "status": "success"}
     except Exception as e:
         return {"error": str(e), "status": "error"}
 
-def optimize_chart(config: Dict[str, Any]) -> Dict[str, Any]:
-    """优化图表配置"""
+def optimize_chart(config: Dict[str, Any], profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """优化图表配置，根据数据概况调整坐标轴"""
     try:
-        optimized_config = EChartsUtils.optimize_config(config)
+        optimized_config = EChartsUtils.optimize_config(config, profile)
         return {"config": optimized_config, "status": "success"}
     except Exception as e:
         return {"error": str(e), "status": "error"}
 
-def generate_html(config: Dict[str, Any], height: str = "400px") -> Dict[str, Any]:
+def generate_html(config: Dict[str, Any], height: str = "400px",
+                  significant_digits: Optional[int] = None) -> Dict[str, Any]:
     """生成包含图表的 HTML"""
     try:
+        if significant_digits is not None:
+            config = EChartsUtils.quantize_config(config, significant_digits)
         html = EChartsUtils.generate_html(config, height)
         return {"html": html, "status": "success"}
     except Exception as e:
         return {"error": str(e), "status": "error"}
 
+def generate_dashboard(configs: List[Dict[str, Any]], title: str = "ECharts 仪表板",
+                       height: str = "400px", columns: int = 1,
+                       significant_digits: Optional[int] = None) -> Dict[str, Any]:
+    """生成包含多个图表的单页仪表板 HTML"""
+    try:
+        if significant_digits is not None:
+            configs = [EChartsUtils.quantize_config(config, significant_digits) for config in configs]
+        html = EChartsUtils.generate_dashboard_html(configs, title, height, columns)
+        return {"html": html, "charts": len(configs), "status": "success"}
+    except Exception as e:
+        return {"error": str(e), "status": "error"}
+
+def refine_chart(instruction: str, session_id: Optional[str] = None,
+                 config: Optional[Dict[str, Any]] = None, version: Optional[int] = None) -> Dict[str, Any]:
+    """按指令增量修改图表，只把不含数据的配置骨架发送给模型，返回的补丁在本地应用"""
+    try:
+        if session_id is None:
+            if config is None:
+                raise ValueError("新建会话需要提供 config")
+            # 会话在补丁成功应用后才创建，失败的调用不会留下孤立会话挤占 LRU
+            base = {"version": 0, "config": config}
+        elif config is not None:
+            raise ValueError("已有会话时不能再提供 config")
+        else:
+            base = chart_sessions.get(session_id, version)
+        skeleton, refs = strip_data(base["config"])
+        details = get_deepseek_client().refine_echarts_config(skeleton, instruction)
+        patch = details.pop("patch")
+        
+        refined = apply_merge_patch(base["config"], resolve_data_refs(patch, refs))
+        if not EChartsUtils.validate_config(refined):
+            raise ValueError("应用补丁后的配置无效")
+        if session_id is None:
+            session_id, _ = chart_sessions.create(config)
+        new_version = chart_sessions.commit(session_id, refined, instruction, patch)
+        return {
+            "config": refined,
+            "session_id": session_id,
+            "version": new_version,
+            "base_version": base["version"],
+            "patch": patch,
+            "status": "success",
+            **details
+        }
+    except SchedulerOverloaded:
+        # 交给传输层返回 503 和重试时间
+        raise
+    except KeyError as e:
+        return {"error": e.args[0], "status": "error"}
+    except Exception as e:
+        return {"error": str(e), "status": "error"}
+
 def create_and_open_chart(chart_type: str, data: Optional[Dict[str, Any]] = None, 
-                         title: str = "", theme: str = "light", height: str = "400px") -> Dict[str, Any]:
+                         title: str = "", theme: str = "light", height: str = "400px",
+                         data_format: Optional[str] = None, significant_digits: Optional[int] = None,
+                         precision: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
     """创建图表并在浏览器中打开"""
     try:
         # 先创建图表配置
-        config = EChartsUtils.create_chart_config(chart_type, data, title, theme)
+        config = EChartsUtils.create_chart_config(
+            chart_type, data, title, theme, data_format, significant_digits, precision
+        )
         # 然后打开图表
         result = EChartsUtils.generate_and_open_chart(config, height)
         return result
@@ -253,6 +333,93 @@ def open_chart(config: Dict[str, Any], height: str = "400px") -> Dict[str, Any]:
     except Exception as e:
         return {"error": str(e), "status": "error"}
 
+def _build_parameters_schema(params_model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    由参数模型生成工具的 JSON Schema
+    
+    去掉 pydantic 自动生成的 title，并把 Optional 字段的 anyOf 折叠为单一类型，
+    使输出与手写 Schema 保持一致。
+    """
+    schema = params_model.model_json_schema()
+    schema.pop("title", None)
+    for prop in schema.get("properties", {}).values():
+        prop.pop("title", None)
+        any_of = prop.get("anyOf")
+        if any_of:
+            non_null = [item for item in any_of if item.get("type") != "null"]
+            if len(non_null) == 1:
+                del prop["anyOf"]
+                prop.update(non_null[0])
+    return schema
+
+class ToolSpec:
+    """工具注册项：描述、参数模型和实现函数"""
+    
+    def __init__(self, description: str, params_model: Type[BaseModel],
+                 handler: Callable[..., Dict[str, Any]]):
+        self.description = description
+        self.params_model = params_model
+        self.handler = handler
+        self.field_names = tuple(params_model.model_fields)
+        self.schema = _build_parameters_schema(params_model)
+
+# 工具注册
+TOOL_REGISTRY: Dict[str, ToolSpec] = {
+    "generate_echarts_config": ToolSpec(
+        "使用 DeepSeek 生成 ECharts 配置", GenerateEchartsConfigParams, generate_echarts_config
+    ),
+    "create_chart": ToolSpec("创建指定类型的图表", CreateChartParams, create_chart),
+    "process_data": ToolSpec("处理和转换数据", ProcessDataParams, process_data),
+    "optimize_chart": ToolSpec("优化图表配置，并根据数据概况选择坐标轴类型和范围", OptimizeChartParams, optimize_chart),
+    "generate_html": ToolSpec("生成包含图表的 HTML", GenerateHtmlParams, generate_html),
+    "generate_dashboard": ToolSpec(
+        "生成包含多个图表的单页仪表板 HTML，图表滚动到可视区域时才初始化", GenerateDashboardParams, generate_dashboard
+    ),
+    "refine_chart": ToolSpec(
+        "按指令增量修改图表：在服务器端保存带版本的图表会话，只把不含数据的配置骨架发给模型并在本地应用返回的 JSON Merge Patch",
+        RefineChartParams, refine_chart
+    ),
+    "create_and_open_chart": ToolSpec(
+        "创建图表并在浏览器中打开", CreateAndOpenChartParams, create_and_open_chart
+    ),
+    "open_chart": ToolSpec("在浏览器中打开现有图表配置", OpenChartParams, open_chart),
+}
+
+# 工具列表（/tools 与 MCP tools/list 使用）
+TOOLS = {
+    name: {"description": spec.description, "parameters": spec.schema}
+    for name, spec in TOOL_REGISTRY.items()
+}
+
+def execute_tool(tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按名称调用工具函数，HTTP 和 stdio 传输共用
+    
+    参数先经过工具的参数模型校验，不合法的调用在执行任何数据处理或模型调用之前被拒绝。
+    
+    Args:
+        tool_name: 工具名称
+        parameters: 工具参数
+        
+    Returns:
+        工具执行结果
+    """
+    spec = TOOL_REGISTRY.get(tool_name)
+    if spec is None:
+        return {"error": f"未知工具: {tool_name}", "status": "error"}
+    
+    try:
+        params = spec.params_model.model_validate(parameters)
+    except ValidationError as e:
+        details = "; ".join(
+            f"{'.'.join(str(loc) for loc in err['loc']) or '参数'}: {err['msg']}"
+            for err in e.errors()
+        )
+        return {"error": f"参数校验失败: {details}", "status": "error"}
+    
+    # 按字段直接取值，避免 model_dump 复制大型数据
+    return spec.handler(**{name: getattr(params, name) for name in spec.field_names})
+
 # API 路由
 @app.get("/health")
 def health_check():
@@ -264,70 +431,116 @@ def list_tools():
     """列出可用工具"""
     return {"tools": TOOLS}
 
-@app.post("/call")
-def call_tool(request: MCPRequest):
-    """调用工具"""
+@app.get("/stats")
+def get_stats():
+    """查看规则路由命中率、相似提示缓存和压缩缓存统计"""
+    prompt_cache = get_deepseek_client().prompt_cache
+    return {
+        "intent_router": intent_router.stats(),
+        "prompt_cache": prompt_cache.stats() if prompt_cache is not None else None,
+        "compression_cache": compression_cache.stats(),
+        "model_router": _deepseek_client.model_router.stats() if _deepseek_client is not None else {},
+        "llm_scheduler": _deepseek_client.scheduler.stats() if _deepseek_client is not None else None,
+        "data_workers": data_workers.stats(),
+        "data_profiles": DataProcessor.profile_cache_stats()
+    }
+
+@app.post("/call", response_model=MCPResponse)
+async def call_tool(request: Request):
+    """
+    调用工具，context.priority 可设为 batch 以降低上游模型调用的优先级
+    
+    请求体按块增量解析，超过 MAX_REQUEST_BYTES 或单个参数超过 MAX_FIELD_BYTES 时返回 413，
+    不会先把整个请求体读入内存。执行期间客户端断开时，正在工作进程中处理的数据任务会被取消。
+    """
+    content_length = request.headers.get("content-length")
+    try:
+        body = await parse_request_body(
+            request.stream(), int(content_length) if content_length and content_length.isdigit() else None
+        )
+    except RequestTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        mcp_request = MCPRequest.model_validate(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    
+    # 工具在线程池中执行，客户端断开时通过取消信号终止进程池中的数据处理任务
+    cancel = threading.Event()
+    token = current_cancel_event.set(cancel)
+    try:
+        task = asyncio.ensure_future(run_in_threadpool(_call_tools, mcp_request))
+    finally:
+        current_cancel_event.reset(token)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=0.5)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            cancel.set()
+            return await task
+
+def _call_tools(request: MCPRequest) -> MCPResponse:
+    """依次执行请求中的工具调用"""
     tool_responses = []
+    priority = (request.context or {}).get("priority", "interactive")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"未知的优先级: {priority}，可选值: {', '.join(PRIORITIES)}")
     
-    for i, tool_call in enumerate(request.tools):
-        tool_name = tool_call.name
-        parameters = tool_call.parameters
-        
-        # 调用相应的工具函数
-        if tool_name == "generate_echarts_config":
-            result = generate_echarts_config(
-                prompt=parameters.get("prompt"),
-                data=parameters.get("data")
-            )
-        elif tool_name == "create_chart":
-            result = create_chart(
-                chart_type=parameters.get("chart_type"),
-                data=parameters.get("data"),
-                title=parameters.get("title", ""),
-                theme=parameters.get("theme", "light")
-            )
-        elif tool_name == "process_data":
-            result = process_data(
-                data=parameters.get("data"),
-                data_type=parameters.get("data_type"),
-                chart_type=parameters.get("chart_type")
-            )
-        elif tool_name == "optimize_chart":
-            result = optimize_chart(
-                config=parameters.get("config")
-            )
-        elif tool_name == "generate_html":
-            result = generate_html(
-                config=parameters.get("config"),
-                height=parameters.get("height", "400px")
-            )
-        elif tool_name == "create_and_open_chart":
-            result = create_and_open_chart(
-                chart_type=parameters.get("chart_type"),
-                data=parameters.get("data"),
-                title=parameters.get("title", ""),
-                theme=parameters.get("theme", "light"),
-                height=parameters.get("height", "400px")
-            )
-        elif tool_name == "open_chart":
-            result = open_chart(
-                config=parameters.get("config"),
-                height=parameters.get("height", "400px")
-            )
-        else:
-            result = {"error": f"未知工具: {tool_name}", "status": "error"}
-        
-        # 添加到响应
-        tool_responses.append(ToolResponse(
-            tool_call_id=f"tool_{i}",
-            result=result
-        ))
+    with use_priority(priority):
+        for i, tool_call in enumerate(request.tools):
+            try:
+                result = execute_tool(tool_call.name, tool_call.parameters)
+            except SchedulerOverloaded as e:
+                if len(request.tools) == 1:
+                    raise HTTPException(
+                        status_code=503,
+                        detail=str(e),
+                        headers={"Retry-After": str(math.ceil(e.retry_after))}
+                    )
+                # 多个工具时只把该工具标记为失败，保留其他工具已算出的结果
+                result = {"error": str(e), "status": "error", "retry_after": math.ceil(e.retry_after)}
+            
+            # 添加到响应
+            tool_responses.append(ToolResponse(
+                tool_call_id=f"tool_{i}",
+                result=result
+            ))
     
     return MCPResponse(
         tool_responses=tool_responses,
         status="completed"
     )
 
+@app.post("/batch")
+def batch_generate(request: BatchRequest):
+    """批量生成图表，以 NDJSON 流式返回结果"""
+    output_dir = None
+    if request.output_dir:
+        try:
+            output_dir = BatchProcessor.resolve_output_dir(request.output_dir)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    lines = BatchProcessor.stream_ndjson(
+        request.jobs,
+        output_dir=output_dir,
+        max_workers=request.max_workers,
+        chunk_size=request.chunk_size
+    )
+
+    async def stream():
+        try:
+            async for line in iterate_in_threadpool(lines):
+                yield line
+        finally:
+            # 客户端断开时关闭生成器，取消尚未开始的任务
+            lines.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 # 根路径
 @app.get("/")
 def root():
@@ -338,7 +551,9 @@ def root():
         "endpoints": {
             "/health": "健康检查",
             "/tools": "列出可用工具",
-            "/call": "调用工具"
+            "/call": "调用工具",
+            "/batch": "批量生成图表",
+            "/stats": "路由与缓存统计"
         }
     }
 
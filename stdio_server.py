@@ -0,0 +1,173 @@
+import json
+import math
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, TextIO
+
+from config import settings
+from server import TOOLS, execute_tool
+from llm_scheduler import SchedulerOverloaded
+
+
+# JSON-RPC 错误码
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# 服务端自定义错误码：上游模型调用繁忙，error.data.retryAfter 为建议的重试秒数
+SERVER_OVERLOADED = -32000
+
+# 默认 MCP 协议版本，客户端指定时使用客户端的版本
+DEFAULT_PROTOCOL_VERSION = "2024-11-05"
+
+
+class StdioServer:
+    """MCP stdio 传输：通过标准输入输出收发按行分隔的 JSON-RPC 消息"""
+
+    def __init__(self, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None,
+                 max_workers: Optional[int] = None):
+        """
+        初始化 stdio 服务器
+
+        Args:
+            stdin: 输入流，默认为 sys.stdin
+            stdout: 输出流，默认为 sys.stdout
+            max_workers: 并发执行 tools/call 的最大线程数
+        """
+        self.stdin = stdin or sys.stdin
+        self.stdout = stdout or sys.stdout
+        self.max_workers = max_workers or settings.STDIO_MAX_WORKERS
+        self._write_lock = threading.Lock()
+
+    def serve(self) -> None:
+        """读取请求直到输入结束；tools/call 并发执行，结果完成后立即写回"""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mcp-tool") as executor:
+            for line in self.stdin:
+                line = line.strip()
+                if not line:
+                    continue
+
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError as e:
+                    self._send_error(None, PARSE_ERROR, f"JSON 解析失败: {str(e)}")
+                    continue
+
+                if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+                    self._send_error(message.get("id") if isinstance(message, dict) else None,
+                                     INVALID_REQUEST, "无效的 JSON-RPC 请求")
+                    continue
+
+                # 工具调用放入线程池，其余方法开销很小，直接处理
+                if message["method"] == "tools/call":
+                    executor.submit(self._handle_message, message)
+                else:
+                    self._handle_message(message)
+
+    def _handle_message(self, message: Dict[str, Any]) -> None:
+        """
+        处理单条 JSON-RPC 消息
+
+        Args:
+            message: JSON-RPC 请求或通知
+        """
+        msg_id = message.get("id")
+        method = message["method"]
+        params = message.get("params") or {}
+
+        # 通知（无 id）不需要响应
+        if "id" not in message:
+            return
+
+        if not isinstance(params, dict):
+            self._send_error(msg_id, INVALID_PARAMS, "params 必须是对象")
+            return
+
+        try:
+            if method == "initialize":
+                result = self._initialize(params)
+            elif method == "ping":
+                result = {}
+            elif method == "tools/list":
+                result = self._list_tools()
+            elif method == "tools/call":
+                name = params.get("name")
+                if name not in TOOLS:
+                    self._send_error(msg_id, INVALID_PARAMS, f"未知工具: {name}")
+                    return
+                arguments = params.get("arguments") or {}
+                if not isinstance(arguments, dict):
+                    self._send_error(msg_id, INVALID_PARAMS, "params.arguments 必须是对象")
+                    return
+                result = self._call_tool(name, arguments)
+            else:
+                self._send_error(msg_id, METHOD_NOT_FOUND, f"不支持的方法: {method}")
+                return
+        except SchedulerOverloaded as e:
+            self._send_error(msg_id, SERVER_OVERLOADED, str(e), {"retryAfter": math.ceil(e.retry_after)})
+            return
+        except Exception as e:
+            self._send_error(msg_id, INTERNAL_ERROR, str(e))
+            return
+
+        self._send({"jsonrpc": "2.0", "id": msg_id, "result": result})
+
+    def _initialize(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """处理 initialize 请求"""
+        return {
+            "protocolVersion": params.get("protocolVersion", DEFAULT_PROTOCOL_VERSION),
+            "capabilities": {"tools": {"listChanged": False}},
+            "serverInfo": {"name": "deepseek-echarts-mcp", "version": "1.0.0"}
+        }
+
+    def _list_tools(self) -> Dict[str, Any]:
+        """将 TOOLS 注册表转换为 MCP tools/list 格式"""
+        return {
+            "tools": [
+                {
+                    "name": name,
+                    "description": tool["description"],
+                    "inputSchema": tool["parameters"]
+                }
+                for name, tool in TOOLS.items()
+            ]
+        }
+
+    def _call_tool(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        调用工具并转换为 MCP tools/call 结果
+
+        Args:
+            name: 工具名称
+            arguments: 工具参数
+
+        Returns:
+            MCP 工具调用结果
+        """
+        result = execute_tool(name, arguments)
+        return {
+            "content": [{"type": "text", "text": json.dumps(result, ensure_ascii=False)}],
+            "structuredContent": result,
+            "isError": result.get("status") == "error"
+        }
+
+    def _send_error(self, msg_id: Any, code: int, message: str, data: Optional[Dict[str, Any]] = None) -> None:
+        """发送 JSON-RPC 错误响应"""
+        error = {"code": code, "message": message}
+        if data is not None:
+            error["data"] = data
+        self._send({"jsonrpc": "2.0", "id": msg_id, "error": error})
+
+    def _send(self, message: Dict[str, Any]) -> None:
+        """写出一条消息，多个线程同时完成时逐条写入"""
+        line = json.dumps(message, ensure_ascii=False)
+        with self._write_lock:
+            self.stdout.write(line + "\n")
+            self.stdout.flush()
+
+
+# 启动 stdio 服务器
+if __name__ == "__main__":
+    StdioServer().serve()